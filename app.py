@@ -1,16 +1,23 @@
 # Em app.py (VERSÃO FINAL DE PRODUÇÃO)
+import os
+import shutil
+import time
+import uuid
 import streamlit as st
-import pandas as pd
-import numpy as np
 from datetime import datetime
-import altair as alt
 
-from core.data_loader import get_available_snapshots, get_data_for_snapshot, get_net_history_as_df
+# Só módulos leves aqui: o pandas, o BigQuery e o altair são importados na primeira vez que uma
+# aba precisa deles, para a barra lateral aparecer rápido num container recém-iniciado.
+from core.jobs import get_job_manager, CONCLUIDO, CANCELADO
+from core.rfv_rules import RFV_RULES_ANTIGO, RFV_RULES_NOVO
+from core.snapshot_index import get_snapshot_index
+from utils.logger import request_trace, span
 
 st.set_page_config(layout="wide", page_title="B.blend RFV Tava -> Tá")
 st.title("Análise de Migração RFV - B.blend")
 
-opcoes_snapshot_disponiveis = get_available_snapshots()
+# Lido do índice persistido (core/snapshot_index.py), atualizado em segundo plano
+opcoes_snapshot_disponiveis = get_snapshot_index()
 
 if not opcoes_snapshot_disponiveis:
     st.error("Erro Crítico: Não foi possível carregar as datas de análise do BigQuery.")
@@ -29,8 +36,197 @@ with st.sidebar:
         opcoes_foco_map = {"Geral": "categoria_geral_antigo", "Cápsulas": "categoria_capsulas_antigo", "Insumos": "categoria_insumos_antigo"}
     tipo_rfv_foco_label = st.selectbox("Escolha o Tipo de RFV para Análise:", list(opcoes_foco_map.keys()))
     coluna_categoria_selecionada = opcoes_foco_map[tipo_rfv_foco_label]
+    st.checkbox("Mostrar painel de debug", key="debug_panel", value=os.environ.get("RFV_DEBUG_PANEL") == "1")
 
-tab_matriz, tab_net = st.tabs(["Matriz de Migração", "Histórico de Atividade"])
+# As buscas rodam em segundo plano (core/jobs.py): a sessão não trava, o progresso aparece na tela
+# e um job em andamento sobrevive aos reruns do Streamlit sem ser reiniciado.
+job_manager = get_job_manager()
+# Identifica a sessão entre as que acompanham um job: "Cancelar" só desliga esta sessão do job
+session_id = st.session_state.setdefault('session_id', uuid.uuid4().hex)
+
+def submeter_job(session_key, key, fn, **kwargs):
+    """Submete (ou reaproveita) o job da chave e o associa a esta sessão em session_key."""
+    job = job_manager.submit(key, fn, session_id=session_id, **kwargs)
+    st.session_state[session_key] = job.key
+    st.session_state.pop(f"{session_key}_cancelado", None)
+    return job
+
+@st.fragment(run_every=1.0)
+def painel_job(job, session_key):
+    """Acompanha um job em andamento; quando ele termina, recarrega a página para mostrar o resultado."""
+    if job.done:
+        st.rerun()
+    st.progress(job.progress_value, text=job.messages[-1] if job.messages else job.description)
+    st.caption(f"{job.description} ({job.elapsed_seconds:.0f}s)")
+    if st.button("Cancelar", key=f"cancelar_{job.id}"):
+        # Outras sessões podem estar acompanhando o mesmo job: ele só para quando a última sair
+        job_manager.detach(job, session_id)
+        st.session_state[f"{session_key}_cancelado"] = job.id
+        st.rerun()
+
+def com_trace(nome, fn):
+    """Envolve a função de um job num trace de instrumentação (tempos por etapa, memória)."""
+    def run(job):
+        with request_trace(nome) as trace:
+            job.trace = trace
+            return fn(job)
+    return run
+
+def painel_debug(job):
+    """Painel opcional com o detalhamento da última execução (BigQuery, pandas, renderização)."""
+    if not st.session_state.get('debug_panel') or job is None or job.trace is None:
+        return
+    import pandas as pd
+    from core.data_loader import get_query_stats
+
+    with st.expander("Debug: tempos da última execução"):
+        st.json(job.trace.summary)
+        st.dataframe(pd.DataFrame(job.trace.as_records()))
+        st.caption("Contadores de queries (hits / misses / coalesced)")
+        st.json(get_query_stats())
+
+# Funções dos jobs: o data_loader (e com ele o BigQuery) só é importado quando uma análise é pedida.
+# Uma falha (None / DataFrame vazio do data_loader) vira exceção: o job termina com erro e um novo
+# clique roda de novo, em vez de reaproveitar o resultado vazio.
+def calcular_matriz(data_tava, data_ta, coluna):
+    from core.data_loader import get_migration_matrix
+    matriz = get_migration_matrix(data_tava, data_ta, coluna)
+    if matriz is None:
+        raise RuntimeError("Falha ao calcular a matriz de migração.")
+    return matriz
+
+def montar_indice_drill_down(data_tava, data_ta, coluna):
+    from core.data_loader import get_migration_index
+    indice = get_migration_index(data_tava, data_ta, coluna)
+    if indice is None:
+        raise RuntimeError("Falha ao montar o índice de drill-down.")
+    return indice
+
+def calcular_historico_net(coluna):
+    from core.data_loader import get_net_history_as_df
+    df = get_net_history_as_df(coluna)
+    if df.empty:
+        raise RuntimeError("Falha ao calcular o histórico de NET.")
+    return df
+
+def job_da_sessao(session_key):
+    """Job associado a esta sessão; enquanto roda, mostra o painel de progresso e retorna None."""
+    job = job_manager.get(st.session_state.get(session_key))
+    if job is None:
+        return None
+    if job.status == CANCELADO or st.session_state.get(f"{session_key}_cancelado") == job.id:
+        st.info("Processamento cancelado.")
+        return None
+    if not job.done:
+        painel_job(job, session_key)
+        return None
+    return job
+
+def reordenar_matriz(tabela_base, modelo_label):
+    """Ordena linhas e colunas da matriz pela hierarquia das categorias do modelo."""
+    if modelo_label == 'Modelo Novo':
+        ORDER_Y = ['DIAMANTE', 'OURO', 'PRATA', 'BRONZE', 'NOVO CLIENTE', 'CHURN', 'ENTRANTE NA BASE']
+        ORDER_X = ['CHURN', 'NOVO CLIENTE', 'BRONZE', 'PRATA', 'OURO', 'DIAMANTE']
+    else:
+        ORDER_Y = ['ELITE', 'POTENCIAL ELITE', 'CLIENTE LEAL', 'PROMISSOR', 'PEGANDO NO SONO', 'EM RISCO', 'ADORMECIDO', 'NOVO CLIENTE', 'CHURN', 'ENTRANTE NA BASE']
+        ORDER_X = ['CHURN', 'NOVO CLIENTE', 'ADORMECIDO', 'EM RISCO', 'PEGANDO NO SONO', 'PROMISSOR', 'CLIENTE LEAL', 'POTENCIAL ELITE', 'ELITE']
+    present_y = tabela_base.index.tolist(); present_x = tabela_base.columns.tolist()
+    final_order_y = [cat for cat in ORDER_Y if cat in present_y] + sorted([cat for cat in present_y if cat not in ORDER_Y])
+    final_order_x = [cat for cat in ORDER_X if cat in present_x] + sorted([cat for cat in present_x if cat not in ORDER_X])
+    return tabela_base.reindex(index=final_order_y, columns=final_order_x, fill_value=0)
+
+CLIENTES_POR_PAGINA = 100
+
+# Exportações do drill-down, servidas pelo Streamlit (server.enableStaticServing, em .streamlit/config.toml)
+EXPORTACOES_URL = "exportacoes"
+EXPORTACOES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", EXPORTACOES_URL)
+EXPORTACAO_TTL_SECONDS = int(os.environ.get("RFV_EXPORTACAO_TTL_SECONDS", 3600))
+
+def remover_exportacoes(arquivo_anterior=None):
+    """Apaga a exportação anterior da sessão e as abandonadas (mais velhas que EXPORTACAO_TTL_SECONDS)."""
+    if arquivo_anterior:
+        shutil.rmtree(arquivo_anterior[0], ignore_errors=True)
+    if not os.path.isdir(EXPORTACOES_DIR):
+        return
+    limite = time.time() - EXPORTACAO_TTL_SECONDS
+    for entrada in os.scandir(EXPORTACOES_DIR):
+        try:
+            if entrada.is_dir() and entrada.stat().st_mtime < limite:
+                shutil.rmtree(entrada.path, ignore_errors=True)
+        except FileNotFoundError:
+            pass
+
+def painel_drill_down(job_matriz, tabela_reordenada):
+    """Lista os clientes de uma célula da matriz (paginada) e exporta a lista em CSV ou Parquet."""
+    st.subheader("Detalhar Célula (Lista de Clientes)")
+    _, data_tava, data_ta, coluna = job_matriz.key
+    chave = ('drill_down', data_tava, data_ta, coluna)
+    if st.button("Carregar clientes por célula", key="btn_drill_down"):
+        submeter_job(
+            'job_drill_down',
+            chave,
+            com_trace('drill_down', lambda job: montar_indice_drill_down(data_tava, data_ta, coluna)),
+            description="Montando o índice de clientes da matriz...",
+        )
+    if st.session_state.get('job_drill_down') != chave:
+        return
+
+    job = job_da_sessao('job_drill_down')
+    if job is None:
+        return
+    indice = job.result if job.status == CONCLUIDO else None
+    if indice is None:
+        st.error("Não foi possível montar a lista de clientes. Verifique os logs do Cloud Run para mais detalhes.")
+        return
+
+    import pandas as pd
+    from core.migration_index import export_cell_csv, export_cell_parquet
+
+    col_origem, col_destino = st.columns(2)
+    with col_origem:
+        categoria_tava = st.selectbox("Categoria 'Tava':", tabela_reordenada.index.tolist(), key="drill_tava")
+    with col_destino:
+        categoria_ta = st.selectbox("Categoria 'Tá':", tabela_reordenada.columns.tolist(), key="drill_ta")
+
+    total = indice.count(categoria_tava, categoria_ta)
+    n_paginas = max(1, -(-total // CLIENTES_POR_PAGINA))
+    pagina = st.number_input(f"Página (de {n_paginas})", min_value=1, max_value=n_paginas, value=1, step=1, key="drill_pagina")
+    st.caption(f"{total:,} clientes migraram de {categoria_tava} para {categoria_ta}.".replace(",", "."))
+    clientes = indice.get_customers(categoria_tava, categoria_ta, offset=(pagina - 1) * CLIENTES_POR_PAGINA, limit=CLIENTES_POR_PAGINA)
+    st.dataframe(pd.DataFrame({'cod_cliente': clientes}), hide_index=True)
+
+    # A exportação grava em lotes direto na pasta estática do app; o navegador baixa o arquivo do
+    # disco (servido em partes pelo servidor), sem carregar a célula inteira na memória do app
+    formato = st.radio("Formato da exportação:", ["CSV", "Parquet"], horizontal=True, key="drill_formato")
+    if st.button("Preparar arquivo", key="btn_drill_exportar"):
+        remover_exportacoes(st.session_state.pop('drill_arquivo', None))
+        sufixo = '.csv' if formato == "CSV" else '.parquet'
+        nome = f"clientes_{categoria_tava}_para_{categoria_ta}_{data_ta.strftime('%Y%m%d')}{sufixo}".replace(' ', '_')
+        # Uma subpasta aleatória por arquivo: a URL não é adivinhável
+        pasta = os.path.join(EXPORTACOES_DIR, uuid.uuid4().hex)
+        os.makedirs(pasta)
+        exportar = export_cell_csv if formato == "CSV" else export_cell_parquet
+        exportar(indice, categoria_tava, categoria_ta, os.path.join(pasta, nome))
+        st.session_state['drill_arquivo'] = (pasta, nome, categoria_tava, categoria_ta)
+    arquivo = st.session_state.get('drill_arquivo')
+    if arquivo and arquivo[2:] == (categoria_tava, categoria_ta) and os.path.exists(os.path.join(arquivo[0], arquivo[1])):
+        pasta, nome, _, _ = arquivo
+        url = f"app/static/{EXPORTACOES_URL}/{os.path.basename(pasta)}/{nome}"
+        st.markdown(f'<a href="{url}" download="{nome}">Baixar arquivo</a>', unsafe_allow_html=True)
+        st.caption(f"O arquivo fica disponível por {EXPORTACAO_TTL_SECONDS // 60} minutos.")
+
+@st.cache_resource(max_entries=4, show_spinner="Carregando métricas brutas dos snapshots...")
+def carregar_simulador(data_tava, data_ta, foco):
+    """Simulador de regras para o par de snapshots (o alinhamento dos clientes é feito uma vez)."""
+    from core.rule_simulator import RuleSimulator, load_raw_metrics
+
+    raw_tava, raw_ta = load_raw_metrics(data_tava, foco), load_raw_metrics(data_ta, foco)
+    if raw_tava is None or raw_ta is None:
+        # Exceção em vez de None: o Streamlit não guarda o resultado e tenta de novo na próxima vez
+        raise FileNotFoundError(f"Métricas brutas de '{foco}' não encontradas para os snapshots selecionados.")
+    return RuleSimulator(raw_tava, raw_ta, foco)
+
+tab_matriz, tab_simulador, tab_net = st.tabs(["Matriz de Migração", "Simulador de Regras", "Histórico de Atividade"])
 
 with tab_matriz:
     st.header("Análise de Migração 'Tava -> Tá'")
@@ -51,65 +247,129 @@ with tab_matriz:
 
     if st.button("Processar Análise de Migração", key="btn_matriz"):
         if data_tava_selecionada:
-            with st.spinner("Buscando dados e gerando matriz..."):
-                df_tava = get_data_for_snapshot(data_tava_selecionada)
-                df_ta = get_data_for_snapshot(data_ta_selecionada)
-            
-            if df_tava is not None and df_ta is not None:
-                # Se não houve erro, continua com a lógica normal
-                df_tava_segmento = df_tava[['cod_cliente', coluna_categoria_selecionada]].rename(columns={coluna_categoria_selecionada: 'categoria'})
-                df_ta_segmento = df_ta[['cod_cliente', coluna_categoria_selecionada]].rename(columns={coluna_categoria_selecionada: 'categoria'})
-                df_merged = pd.merge(df_tava_segmento, df_ta_segmento, on='cod_cliente', how='outer', suffixes=('_tava', '_ta'))
-                df_merged['categoria_tava'].fillna('ENTRANTE NA BASE', inplace=True); df_merged['categoria_ta'].fillna('CHURN', inplace=True)
-                
-                if modelo_rfv_label == 'Modelo Novo':
-                    ORDER_Y = ['DIAMANTE', 'OURO', 'PRATA', 'BRONZE', 'NOVO CLIENTE', 'CHURN', 'ENTRANTE NA BASE']
-                    ORDER_X = ['CHURN', 'NOVO CLIENTE', 'BRONZE', 'PRATA', 'OURO', 'DIAMANTE']
-                else:
-                    ORDER_Y = ['ELITE', 'POTENCIAL ELITE', 'CLIENTE LEAL', 'PROMISSOR', 'PEGANDO NO SONO', 'EM RISCO', 'ADORMECIDO', 'NOVO CLIENTE', 'CHURN', 'ENTRANTE NA BASE']
-                    ORDER_X = ['CHURN', 'NOVO CLIENTE', 'ADORMECIDO', 'EM RISCO', 'PEGANDO NO SONO', 'PROMISSOR', 'CLIENTE LEAL', 'POTENCIAL ELITE', 'ELITE']
-                
-                st.markdown(f"##### Análise comparando **{data_tava_selecionada.strftime('%d/%m/%Y')} (Tava)** com **{data_ta_selecionada.strftime('%d/%m/%Y')} (Tá)**.")
-                tabela_base = pd.crosstab(df_merged['categoria_tava'], df_merged['categoria_ta'])
-                present_y = tabela_base.index.tolist(); present_x = tabela_base.columns.tolist()
-                final_order_y = [cat for cat in ORDER_Y if cat in present_y] + sorted([cat for cat in present_y if cat not in ORDER_Y])
-                final_order_x = [cat for cat in ORDER_X if cat in present_x] + sorted([cat for cat in present_x if cat not in ORDER_X])
-                tabela_reordenada = tabela_base.reindex(index=final_order_y, columns=final_order_x, fill_value=0)
+            # O outer join e o crosstab rodam no BigQuery; só a grade de contagens é baixada
+            submeter_job(
+                'job_matriz',
+                ('matriz', data_tava_selecionada, data_ta_selecionada, coluna_categoria_selecionada),
+                com_trace('matriz_migracao', lambda job, tava=data_tava_selecionada, ta=data_ta_selecionada, coluna=coluna_categoria_selecionada: calcular_matriz(tava, ta, coluna)),
+                description="Buscando dados e gerando matriz...",
+                params={'data_tava': data_tava_selecionada, 'data_ta': data_ta_selecionada, 'modelo': modelo_rfv_label},
+            )
+        else:
+            st.warning("Por favor, selecione um período 'Tava' válido para gerar a matriz.")
+
+    job = job_da_sessao('job_matriz')
+    if job is not None:
+        tabela_base = job.result if job.status == CONCLUIDO else None
+        if tabela_base is not None:
+            # Se não houve erro, continua com a lógica normal
+            data_tava_job, data_ta_job = job.params['data_tava'], job.params['data_ta']
+
+            with span('app.render_matriz', trace=job.trace, linhas=len(tabela_base)):
+                st.markdown(f"##### Análise comparando **{data_tava_job.strftime('%d/%m/%Y')} (Tava)** com **{data_ta_job.strftime('%d/%m/%Y')} (Tá)**.")
+                tabela_reordenada = reordenar_matriz(tabela_base, job.params['modelo'])
                 tabela_absoluta = tabela_reordenada.copy()
                 tabela_absoluta.loc['Total',:] = tabela_absoluta.sum(axis=0).astype(int)
                 tabela_absoluta['Total'] = tabela_absoluta.sum(axis=1).astype(int)
                 tabela_percentual = tabela_reordenada.div(tabela_reordenada.sum(axis=1), axis=0).fillna(0) * 100
-                
+
                 st.subheader("Visão em Números Absolutos"); st.dataframe(tabela_absoluta.style.format(lambda x: f"{x:,.0f}".replace(",", ".")).background_gradient(cmap='viridis_r'))
                 st.subheader("Visão em Percentual (%)"); st.dataframe(tabela_percentual.style.format('{:.2f}%').background_gradient(cmap='viridis_r'))
-            else:
-                st.error("Não foi possível buscar os dados para uma ou ambas as datas selecionadas. Verifique os logs do Cloud Run para mais detalhes.")
+            painel_drill_down(job, tabela_reordenada)
+            painel_debug(job)
         else:
-            st.warning("Por favor, selecione um período 'Tava' válido para gerar a matriz.")
+            st.error("Não foi possível buscar os dados para uma ou ambas as datas selecionadas. Verifique os logs do Cloud Run para mais detalhes.")
+
+with tab_simulador:
+    st.header("Simulador de Regras (What-if)")
+    st.markdown("Altere as faixas de R, F e V abaixo e veja na hora como ficariam as categorias e a matriz entre os snapshots 'Tava' e 'Tá' escolhidos na aba Matriz de Migração.")
+
+    modelo_simulacao = modelo_rfv_map[modelo_rfv_label]
+    regras_do_modelo = RFV_RULES_NOVO if modelo_simulacao == 'novo' else RFV_RULES_ANTIGO
+    if tipo_rfv_foco_label not in regras_do_modelo:
+        st.info(f"O simulador está disponível para os focos com regras de RFV: {', '.join(regras_do_modelo)}.")
+    elif not data_tava_selecionada:
+        st.warning("Por favor, selecione um período 'Tava' válido na aba Matriz de Migração.")
+    elif not st.toggle("Abrir o simulador", key="abrir_simulador"):
+        st.caption("Ao abrir, o simulador carrega as métricas brutas dos dois snapshots selecionados.")
+    else:
+        import pandas as pd
+        from core.rule_simulator import get_current_rules, rules_from_frame, rules_to_frame
+
+        try:
+            simulador = carregar_simulador(data_tava_selecionada, data_ta_selecionada, tipo_rfv_foco_label)
+        except FileNotFoundError:
+            st.info("As métricas brutas (recência, frequência e volume por cliente) destes snapshots ainda não foram geradas. Para gravá-las, rode no job que gera os snapshots: `python -m core.rule_simulator --state <diretório do estado de RFV>` (ou `--transactions <parquet> --date <AAAA-MM-DD>`).")
+            simulador = None
+
+        if simulador is not None:
+            st.markdown(f"##### {tipo_rfv_foco_label} ({modelo_rfv_label}): **{data_tava_selecionada.strftime('%d/%m/%Y')} (Tava)** -> **{data_ta_selecionada.strftime('%d/%m/%Y')} (Tá)**.")
+            df_regras = st.data_editor(
+                rules_to_frame(get_current_rules(modelo_simulacao, tipo_rfv_foco_label)),
+                num_rows="dynamic",
+                key=f"regras_simulacao_{modelo_simulacao}_{tipo_rfv_foco_label}",
+                column_config={
+                    'dimensao': st.column_config.SelectboxColumn("Dimensão", options=['R', 'F', 'V'], required=True),
+                    'minimo': st.column_config.NumberColumn("Mínimo", required=True),
+                    'maximo': st.column_config.NumberColumn("Máximo (vazio = sem limite)"),
+                    'score': st.column_config.NumberColumn("Score", min_value=0, step=1, required=True),
+                },
+            )
+            try:
+                resultado_atual = simulador.simulate(modelo_simulacao)
+                resultado_simulado = simulador.simulate(modelo_simulacao, rules_from_frame(df_regras))
+            except ValueError as e:
+                st.error(f"Regras inválidas: {e}")
+            else:
+                distribuicao = pd.concat({
+                    'Tá (atual)': resultado_atual['distribuicao']['Tá'],
+                    'Tá (simulado)': resultado_simulado['distribuicao']['Tá'],
+                }, axis=1).fillna(0).astype(int)
+                distribuicao['Diferença'] = distribuicao['Tá (simulado)'] - distribuicao['Tá (atual)']
+                ordem = reordenar_matriz(pd.DataFrame(index=distribuicao.index), modelo_rfv_label).index
+                st.subheader("Distribuição das Categorias no 'Tá'")
+                st.dataframe(distribuicao.reindex(ordem).style.format(lambda x: f"{x:,.0f}".replace(",", ".")))
+
+                matriz_simulada = reordenar_matriz(resultado_simulado['matriz'], modelo_rfv_label)
+                st.subheader("Matriz Tava -> Tá Simulada")
+                st.dataframe(matriz_simulada.style.format(lambda x: f"{x:,.0f}".replace(",", ".")).background_gradient(cmap='viridis_r'))
 
 with tab_net:
     st.header("Histórico Mensal da Taxa de Ativos")
     st.info(f"O gráfico abaixo mostra a evolução da Taxa de Ativos (%) para a análise de '{tipo_rfv_foco_label}' do '{modelo_rfv_label}'.")
     
     if st.button("Gerar Gráfico Histórico", key="btn_net"):
-        with st.spinner("Buscando e agregando dados no BigQuery..."):
-            df_grafico = get_net_history_as_df(coluna_categoria_selecionada)
-        
+        # A chave inclui o snapshot mais recente: um snapshot novo gera um job novo
+        submeter_job(
+            'job_net',
+            ('net', coluna_categoria_selecionada, opcoes_snapshot_disponiveis[0]),
+            com_trace('historico_net', lambda job, coluna=coluna_categoria_selecionada: calcular_historico_net(coluna)),
+            description="Buscando e agregando dados no BigQuery...",
+        )
+
+    job = job_da_sessao('job_net')
+    if job is not None:
+        df_grafico = job.result.copy() if job.status == CONCLUIDO and job.result is not None else None
         if df_grafico is not None and not df_grafico.empty:
-            df_grafico['Total_Maduro'] = df_grafico['Ativo'] + df_grafico['Churn']
-            df_grafico['Taxa_de_Ativos'] = np.where(df_grafico['Total_Maduro'] > 0, (df_grafico['Ativo'] / df_grafico['Total_Maduro']) * 100, 0)
-            df_para_grafico = df_grafico.reset_index().rename(columns={'ano_mes': 'Mês'})
-            
-            base = alt.Chart(df_para_grafico).encode(x=alt.X('Mês:T', title='Mês'))
-            linha = base.mark_line(point=True, strokeWidth=3).encode(y=alt.Y('Taxa_de_Ativos:Q', title='Taxa de Ativos (%)', scale=alt.Scale(zero=False)))
-            rotulos = base.mark_text(align='left', baseline='middle', dx=7, fontSize=12).encode(text=alt.Text('Taxa_de_Ativos:Q', format='.1f'), y=alt.Y('Taxa_de_Ativos:Q'))
-            
-            st.subheader(f"Evolução Mensal da Taxa de Ativos")
-            st.altair_chart(linha + rotulos, use_container_width=True)
-            
-            with st.expander("Ver dados detalhados do gráfico"):
-                df_grafico_display = df_grafico.copy()
-                df_grafico_display['Taxa_de_Ativos'] = df_grafico_display['Taxa_de_Ativos'].map('{:.2f}%'.format)
-                st.dataframe(df_grafico_display)
+            import altair as alt
+            import numpy as np
+
+            with span('app.render_net', trace=job.trace, meses=len(df_grafico)):
+                df_grafico['Total_Maduro'] = df_grafico['Ativo'] + df_grafico['Churn']
+                df_grafico['Taxa_de_Ativos'] = np.where(df_grafico['Total_Maduro'] > 0, (df_grafico['Ativo'] / df_grafico['Total_Maduro']) * 100, 0)
+                df_para_grafico = df_grafico.reset_index().rename(columns={'ano_mes': 'Mês'})
+
+                base = alt.Chart(df_para_grafico).encode(x=alt.X('Mês:T', title='Mês'))
+                linha = base.mark_line(point=True, strokeWidth=3).encode(y=alt.Y('Taxa_de_Ativos:Q', title='Taxa de Ativos (%)', scale=alt.Scale(zero=False)))
+                rotulos = base.mark_text(align='left', baseline='middle', dx=7, fontSize=12).encode(text=alt.Text('Taxa_de_Ativos:Q', format='.1f'), y=alt.Y('Taxa_de_Ativos:Q'))
+
+                st.subheader(f"Evolução Mensal da Taxa de Ativos")
+                st.altair_chart(linha + rotulos, use_container_width=True)
+
+                with st.expander("Ver dados detalhados do gráfico"):
+                    df_grafico_display = df_grafico.copy()
+                    df_grafico_display['Taxa_de_Ativos'] = df_grafico_display['Taxa_de_Ativos'].map('{:.2f}%'.format)
+                    st.dataframe(df_grafico_display)
+            painel_debug(job)
         else:
             st.error("Não foi possível gerar os dados para o gráfico. Verifique os logs do Cloud Run para mais detalhes.")
\ No newline at end of file
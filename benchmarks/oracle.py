@@ -0,0 +1,205 @@
+# Em benchmarks/oracle.py
+
+"""
+Verificação dos caminhos vetorizados contra o oráculo de referência: calculate_customer_rfv
+chamado cliente a cliente, como o get_customer_segments original.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.oracle
+    python -m benchmarks.oracle --customers 2000 --seed 3
+
+Compara, em cada (modelo, foco) de FOCUS_COLUMNS, categoria e Total_score de:
+    - get_customer_segments (lote);
+    - get_customer_segments_multi_date (varredura de várias datas);
+    - get_all_customer_segments (todos os focos, no processo e em fatias);
+    - iter_customer_segments (streaming em blocos ordenados por cliente);
+    - RFVStateStore (estado incremental): carga inicial e applies diários com expirações, cada um
+      checado com verify() contra o recálculo completo, e o último dia contra o oráculo.
+
+Os dados sintéticos incluem os casos de borda: data de análise fora da meia-noite, nf_sap nulo
+(inteiros com None, coluna object), volume nulo e volume fracionário. O script termina com
+código 1 se algum caminho divergir do oráculo.
+"""
+
+import argparse
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import generate_transactions
+from core import tava_ta_analyzer
+from core.rfv_calculator import calculate_customer_rfv
+from core.rfv_rules import RFV_RULES_ANTIGO, RFV_RULES_NOVO
+from core.rfv_state import RFVStateStore
+from core.segment_streaming import iter_customer_segments
+from core.tava_ta_analyzer import (
+    FOCUS_COLUMNS, SKU_MAP, get_all_customer_segments, get_category, get_customer_segments, get_customer_segments_multi_date,
+)
+
+ANALYSIS_DATES = [pd.Timestamp('2025-03-31'), pd.Timestamp('2025-06-05 13:00')]
+STATE_DAYS = 10
+
+
+# --- Dados e Oráculo ---
+
+def generate_oracle_transactions(n_customers, seed=0):
+    """Transações sintéticas com os casos de borda que os caminhos vetorizados precisam tratar igual ao oráculo."""
+    rng = np.random.default_rng(seed)
+    df = generate_transactions(n_customers, end_date='2025-06-30', seed=seed)
+    n_rows = len(df)
+    # Horário do dia nas compras (a recência é contada em dias de calendário)
+    df['data_compra'] = df['data_compra'] + pd.to_timedelta(rng.integers(0, 86_400, n_rows), unit='s')
+    # nf_sap nulo: inteiros com None numa coluna object, como chega do BigQuery
+    nf_sap = df['nf_sap'].astype(object)
+    nf_sap[rng.random(n_rows) < 0.03] = None
+    df['nf_sap'] = nf_sap
+    # Volume nulo e fracionário
+    volume = df['volume'].astype('float64')
+    volume[rng.random(n_rows) < 0.02] = np.nan
+    fractional = rng.random(n_rows) < 0.05
+    volume[fractional] += 0.5
+    df['volume'] = volume
+    return df
+
+def reference_segments(df_all_transactions, analysis_date, model_type, focus_type):
+    """Oráculo: calculate_customer_rfv cliente a cliente e get_category escalar, como no get_customer_segments original."""
+    rules_config = (RFV_RULES_NOVO if model_type == 'novo' else RFV_RULES_ANTIGO)[focus_type]
+    df_focus = df_all_transactions[df_all_transactions['tipo_sku'].isin(SKU_MAP[focus_type])]
+    groups = dict(iter(df_focus.groupby('cod_cliente')))
+
+    all_customer_ids = pd.Index(df_all_transactions['cod_cliente'].unique(), name='cod_cliente')
+    scores = [
+        calculate_customer_rfv(groups[customer_id], analysis_date, rules_config)['Total_score'] if customer_id in groups else 0
+        for customer_id in all_customer_ids
+    ]
+    df_results = pd.DataFrame({'Total_score': scores}, index=all_customer_ids)
+    df_results['categoria'] = [get_category(score, model_type) for score in scores]
+
+    first_purchase = df_all_transactions.groupby('cod_cliente')['data_compra'].min().reindex(all_customer_ids)
+    tenure_days = (pd.to_datetime(analysis_date) - first_purchase).dt.days
+    df_results.loc[(tenure_days <= 90).to_numpy(), 'categoria'] = 'NOVO CLIENTE'
+    return df_results[['categoria', 'Total_score']]
+
+
+# --- Comparação ---
+
+def _compare(name, got, expected, columns=('categoria', 'Total_score')):
+    """Problemas (lista de textos) entre um resultado e o oráculo, alinhando pelos clientes do oráculo."""
+    if got.index.has_duplicates:
+        return [f"{name}: clientes duplicados no resultado"]
+    missing = expected.index.difference(got.index)
+    extra = got.index.difference(expected.index)
+    problems = []
+    if len(missing):
+        problems.append(f"{name}: {len(missing)} clientes faltando")
+    if len(extra):
+        problems.append(f"{name}: {len(extra)} clientes a mais")
+    got = got.reindex(expected.index)
+    for column in columns:
+        n_diffs = int((got[column].to_numpy() != expected[column].to_numpy()).sum())
+        if n_diffs:
+            problems.append(f"{name}: {n_diffs} divergências em {column}")
+    return problems
+
+def check_against_oracle(df, analysis_dates, max_workers=2, chunk_rows=2_000):
+    """Roda todos os caminhos e retorna (número de comparações, lista de problemas)."""
+    expected = {
+        (analysis_date, model_type, focus_type): reference_segments(df, analysis_date, model_type, focus_type)
+        for analysis_date in analysis_dates for (model_type, focus_type) in FOCUS_COLUMNS
+    }
+    problems = []
+    n_checks = 0
+
+    for (analysis_date, model_type, focus_type), df_expected in expected.items():
+        got = get_customer_segments(df, analysis_date, model_type, focus_type)
+        problems += _compare(f"lote {model_type}/{focus_type} {analysis_date}", got, df_expected)
+        n_checks += 1
+
+    for (model_type, focus_type) in FOCUS_COLUMNS:
+        df_multi = get_customer_segments_multi_date(df, analysis_dates, model_type, focus_type)
+        for analysis_date in analysis_dates:
+            got = df_multi.xs(analysis_date, level='data_snapshot')
+            problems += _compare(f"multi-data {model_type}/{focus_type} {analysis_date}", got, expected[(analysis_date, model_type, focus_type)])
+            n_checks += 1
+
+    df_sorted = df.sort_values('cod_cliente', kind='stable').reset_index(drop=True)
+    chunks = [df_sorted.iloc[start:start + chunk_rows] for start in range(0, len(df_sorted), chunk_rows)]
+    for analysis_date in analysis_dates:
+        min_rows_per_shard = tava_ta_analyzer.MIN_ROWS_PER_SHARD
+        try:
+            # Dados pequenos: força fatias pequenas para exercitar o caminho com processos
+            tava_ta_analyzer.MIN_ROWS_PER_SHARD = max(1, len(df) // max_workers)
+            results = {
+                'todos os focos': get_all_customer_segments(df, analysis_date, max_workers=1),
+                'todos os focos em fatias': get_all_customer_segments(df, analysis_date, max_workers=max_workers),
+            }
+        finally:
+            tava_ta_analyzer.MIN_ROWS_PER_SHARD = min_rows_per_shard
+        results['streaming'] = pd.concat(iter_customer_segments(chunks, analysis_date))
+
+        for name, df_segments in results.items():
+            for (model_type, focus_type), column in FOCUS_COLUMNS.items():
+                got = df_segments[[column]].rename(columns={column: 'categoria'})
+                problems += _compare(f"{name} {model_type}/{focus_type} {analysis_date}", got, expected[(analysis_date, model_type, focus_type)], columns=('categoria',))
+                n_checks += 1
+
+    return n_checks, problems
+
+def check_state_store(df, last_date, n_days=STATE_DAYS):
+    """
+    Carga inicial do estado incremental e n_days applies diários até last_date. Cada dia é
+    comparado com o recálculo completo (verify); o último, também com o oráculo.
+    """
+    problems = []
+    n_checks = 0
+    dates = list(pd.date_range(end=last_date, periods=n_days + 1, freq='D'))
+    with tempfile.TemporaryDirectory() as state_dir:
+        state_store = RFVStateStore.create(state_dir)
+        previous_date = None
+        for analysis_date in dates:
+            is_new = df['data_compra'] <= analysis_date
+            if previous_date is not None:
+                is_new &= df['data_compra'] > previous_date
+            report = state_store.apply(analysis_date, df[is_new], verify_with=df[df['data_compra'] <= analysis_date])
+            for row in report.itertuples(index=False):
+                n_diffs = row.divergencias_metricas + row.divergencias_categorias + row.clientes_extras
+                if n_diffs:
+                    problems.append(f"estado incremental {row.modelo}/{row.foco} {analysis_date}: {n_diffs} divergências com o recálculo completo")
+                n_checks += 1
+            previous_date = analysis_date
+
+        df_history = df[df['data_compra'] <= last_date]
+        for (model_type, focus_type) in FOCUS_COLUMNS:
+            got = state_store.get_segments(model_type, focus_type)
+            problems += _compare(f"estado incremental {model_type}/{focus_type} {last_date}", got, reference_segments(df_history, last_date, model_type, focus_type))
+            n_checks += 1
+    return n_checks, problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara os caminhos vetorizados com o oráculo cliente a cliente.")
+    parser.add_argument('--customers', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    df = generate_oracle_transactions(args.customers, seed=args.seed)
+    print(f"{len(df)} transações, {df['cod_cliente'].nunique()} clientes, datas {', '.join(str(d) for d in ANALYSIS_DATES)}")
+    n_checks, problems = check_against_oracle(df, ANALYSIS_DATES)
+    n_state_checks, state_problems = check_state_store(df, ANALYSIS_DATES[-1])
+    n_checks += n_state_checks
+    problems += state_problems
+    print(f"{n_checks} comparações com o oráculo")
+
+    if problems:
+        print("\nDIVERGÊNCIAS:")
+        for problem in problems:
+            print(f"  - {problem}")
+        return 1
+    print("Todos os caminhos iguais ao oráculo.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+# Em benchmarks/run_benchmarks.py
+
+"""
+Benchmarks dos caminhos quentes do core, sobre dados sintéticos (benchmarks/synthetic.py).
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.run_benchmarks --customers 10000
+    python -m benchmarks.run_benchmarks --customers 1000000 --only segmentacao
+    python -m benchmarks.run_benchmarks --customers 10000 --update-baselines
+
+Cada benchmark informa o tempo, a vazão (itens por segundo) e o pico de memória (tracemalloc).
+Os resultados são comparados com benchmarks/baselines.json (por benchmark e escala): se a vazão
+cair ou o pico de memória subir além da tolerância, o script termina com código 1.
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import generate_transactions, generate_segment_history
+from core.data_loader import TABELA_RESUMO_ID, CATEGORY_COLUMNS, clear_query_memo, get_net_history_as_df
+from core.local_sql_client import LocalSQLClient
+from core.segment_store import SegmentHistoryStore
+from core.tava_ta_analyzer import get_all_customer_segments, get_categories, get_customer_segments, get_customer_segments_multi_date
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+DEFAULT_TOLERANCE = 0.30
+ANALYSIS_DATE = pd.Timestamp('2025-06-30')
+
+# O histórico de NET roda no SQLite local: limitamos o tamanho para o benchmark não ser dominado por ele
+MAX_NET_HISTORY_CUSTOMERS = 200_000
+
+
+# --- Benchmarks ---
+# Cada função recebe os dados preparados e retorna (função a medir, número de itens processados)
+
+def bench_segmentacao(data):
+    df = data['transactions']
+    return (lambda: get_customer_segments(df, ANALYSIS_DATE, 'novo', 'Cápsulas')), len(df)
+
+def bench_segmentacao_multi_data(data):
+    df = data['transactions']
+    dates = list(pd.date_range(end=ANALYSIS_DATE, periods=13, freq='7D'))
+    return (lambda: get_customer_segments_multi_date(df, dates, 'novo', 'Cápsulas')), len(df) * len(dates)
+
+def bench_segmentacao_todos_focos(data):
+    df = data['transactions']
+    return (lambda: get_all_customer_segments(df, ANALYSIS_DATE)), len(df)
+
+def bench_get_category(data):
+    scores = data['scores']
+    return (lambda: get_categories(scores, 'antigo')), len(scores)
+
+def bench_matriz_migracao(data):
+    store, (data_tava, data_ta) = data['store'], data['store'].snapshots[-2:]
+    return (lambda: store.get_migration_matrix('categoria_geral_novo', data_tava, data_ta)), len(store.customers)
+
+def bench_historico_net(data):
+    client, cache_path = data['sql_client'], data['net_cache_path']
+
+    def run():
+        # Sem cache: mede a agregação completa do histórico
+        clear_query_memo()
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+        return get_net_history_as_df('categoria_geral_novo', client=client, cache_path=cache_path)
+    return run, data['net_history_rows']
+
+BENCHMARKS = {
+    'segmentacao': bench_segmentacao,
+    'segmentacao_multi_data': bench_segmentacao_multi_data,
+    'segmentacao_todos_focos': bench_segmentacao_todos_focos,
+    'get_category': bench_get_category,
+    'matriz_migracao': bench_matriz_migracao,
+    'historico_net': bench_historico_net,
+}
+
+
+# --- Preparação dos Dados ---
+
+def prepare_data(n_customers, order_skew, seed, tmp_dir, names):
+    data = {}
+    if {'segmentacao', 'segmentacao_multi_data', 'segmentacao_todos_focos'} & set(names):
+        data['transactions'] = generate_transactions(n_customers, end_date=ANALYSIS_DATE, order_skew=order_skew, seed=seed)
+    if 'get_category' in names:
+        data['scores'] = np.random.default_rng(seed).integers(0, 10, n_customers * 10)
+    if 'matriz_migracao' in names:
+        snapshots = pd.date_range(end=ANALYSIS_DATE, periods=2, freq='7D')
+        history = generate_segment_history(n_customers, snapshots, columns=['categoria_geral_novo'], seed=seed)
+        data['store'] = SegmentHistoryStore.build(os.path.join(tmp_dir, 'store'), history, ['categoria_geral_novo'])
+    if 'historico_net' in names:
+        snapshots = pd.date_range(end=ANALYSIS_DATE, periods=26, freq='7D')
+        history = generate_segment_history(min(n_customers, MAX_NET_HISTORY_CUSTOMERS), snapshots, columns=CATEGORY_COLUMNS, seed=seed)
+        data['sql_client'] = LocalSQLClient()
+        data['sql_client'].load_table(TABELA_RESUMO_ID, history)
+        data['net_cache_path'] = os.path.join(tmp_dir, 'net_history_counts.parquet')
+        data['net_history_rows'] = len(history)
+    return data
+
+
+# --- Medição ---
+
+def measure(fn, repeats):
+    """Melhor tempo entre `repeats` execuções, e o pico de memória de uma execução extra com tracemalloc."""
+    times = []
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak
+
+def compare_with_baseline(name, result, baseline, tolerance):
+    """Lista de regressões (vazão menor ou memória maior que a baseline, além da tolerância)."""
+    regressions = []
+    if baseline is None:
+        return regressions
+    if result['throughput'] < baseline['throughput'] * (1 - tolerance):
+        regressions.append(f"{name}: vazão {result['throughput']:,.0f}/s abaixo da baseline {baseline['throughput']:,.0f}/s")
+    if result['peak_memory_mb'] > baseline['peak_memory_mb'] * (1 + tolerance):
+        regressions.append(f"{name}: memória {result['peak_memory_mb']:,.1f} MB acima da baseline {baseline['peak_memory_mb']:,.1f} MB")
+    return regressions
+
+def load_baselines(path=BASELINES_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks RFV com dados sintéticos.")
+    parser.add_argument('--customers', type=int, default=10_000, help="Número de clientes sintéticos (10 mil a 5 milhões).")
+    parser.add_argument('--order-skew', type=float, default=1.0, help="Assimetria da distribuição de pedidos por cliente.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help="Roda só os benchmarks indicados.")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="Regressão tolerada (fração).")
+    parser.add_argument('--update-baselines', action='store_true', help="Grava os resultados como nova baseline.")
+    args = parser.parse_args(argv)
+
+    names = args.only or list(BENCHMARKS)
+    scale_key = str(args.customers)
+    baselines = load_baselines()
+    results, regressions = {}, []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"Gerando dados sintéticos para {args.customers:,} clientes...")
+        data = prepare_data(args.customers, args.order_skew, args.seed, tmp_dir, names)
+
+        print(f"{'benchmark':<24}{'tempo (s)':>12}{'itens/s':>16}{'pico (MB)':>12}")
+        for name in names:
+            fn, n_items = BENCHMARKS[name](data)
+            seconds, peak = measure(fn, args.repeats)
+            result = {'seconds': seconds, 'throughput': n_items / seconds, 'peak_memory_mb': peak / 1024**2}
+            results[name] = result
+            print(f"{name:<24}{seconds:>12.3f}{result['throughput']:>16,.0f}{result['peak_memory_mb']:>12.1f}")
+            regressions += compare_with_baseline(name, result, baselines.get(scale_key, {}).get(name), args.tolerance)
+
+    if args.update_baselines:
+        baselines.setdefault(scale_key, {}).update(results)
+        with open(BASELINES_PATH, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"Baselines atualizadas em {BASELINES_PATH}.")
+        return 0
+
+    if regressions:
+        print("\nREGRESSÕES:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+# Em benchmarks/startup.py
+
+"""
+Benchmark de inicialização do app: tempo até a primeira tela num container recém-iniciado.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.startup
+    python -m benchmarks.startup --repeats 10 --budget 1.0
+    python -m benchmarks.startup --query-latency 3
+
+Cada medição roda num processo Python novo (imports frios): importa o Streamlit e executa a
+primeira rodada do app.py (streamlit.testing.v1.AppTest), com um índice de snapshots já gravado,
+sem acesso ao BigQuery. O script termina com código 1 se a mediana passar do orçamento, se a
+primeira rodada der erro ou se ela importar algum módulo pesado (HEAVY_MODULES).
+
+Uma medição extra roda sem índice gravado, como uma instância cujo índice não foi gerado no build
+(ver core/snapshot_index.py): a primeira rodada consulta os snapshots na hora. A consulta é
+simulada com --query-latency segundos (sem BigQuery). Esse caso só é informado, fora do orçamento.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from core.snapshot_index import write_snapshot_index
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT_DIR, "app.py")
+DEFAULT_BUDGET_SECONDS = 1.0
+# Devem ser importados só quando uma aba precisa deles, nunca na primeira rodada
+HEAVY_MODULES = ('pandas', 'pyarrow', 'altair', 'google.cloud.bigquery')
+
+_CHILD_CODE = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+{prelude}
+at = AppTest.from_file({app_path!r}, default_timeout=60)
+at.run()
+finished = time.perf_counter()
+print(json.dumps({{
+    'imports': imported - start,
+    'primeira_rodada': finished - imported,
+    'erro': [str(e.value) for e in at.exception],
+    'modulos_pesados': [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+# Sem índice: a consulta dos snapshots (SELECT DISTINCT no BigQuery) é trocada por uma espera
+_NO_INDEX_PRELUDE = """
+import pandas as pd
+from core import data_loader
+def _fake_available_snapshots(client=None, cache=None):
+    time.sleep({latency!r})
+    return list(pd.date_range(end='2025-06-30', periods=104, freq='7D'))[::-1]
+data_loader.get_available_snapshots = _fake_available_snapshots
+"""
+
+
+def measure_once(index_path, prelude=""):
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT_DIR,
+        RFV_SNAPSHOT_INDEX_PATH=index_path,
+        # O índice recém-gravado não é atualizado durante a medição (sem BigQuery)
+        RFV_SNAPSHOT_INDEX_REFRESH_SECONDS=str(10**9),
+    )
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-c", _CHILD_CODE.format(app_path=APP_PATH, heavy=HEAVY_MODULES, prelude=prelude)],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result['processo'] = time.perf_counter() - start
+    result['total'] = result['imports'] + result['primeira_rodada']
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tempo de inicialização do app (primeira tela).")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET_SECONDS, help="Orçamento em segundos para a mediana.")
+    parser.add_argument('--query-latency', type=float, default=2.0, help="Segundos simulados da consulta de snapshots no caso sem índice.")
+    args = parser.parse_args(argv)
+
+    problems = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_path = os.path.join(tmp_dir, "snapshot_index.json")
+        write_snapshot_index(pd.date_range(end='2025-06-30', periods=104, freq='7D'), index_path)
+
+        print(f"{'medição':<10}{'imports (s)':>14}{'1a rodada (s)':>16}{'total (s)':>12}{'processo (s)':>15}")
+        results = []
+        for i in range(args.repeats):
+            result = measure_once(index_path)
+            results.append(result)
+            print(f"{i + 1:<10}{result['imports']:>14.3f}{result['primeira_rodada']:>16.3f}{result['total']:>12.3f}{result['processo']:>15.3f}")
+            problems += [f"erro na primeira rodada: {erro}" for erro in result['erro']]
+            problems += [f"módulo pesado importado na primeira rodada: {m}" for m in result['modulos_pesados']]
+
+        no_index = measure_once(os.path.join(tmp_dir, "sem_indice", "snapshot_index.json"), _NO_INDEX_PRELUDE.format(latency=args.query_latency))
+        print(f"{'sem índice':<10}{no_index['imports']:>14.3f}{no_index['primeira_rodada']:>16.3f}{no_index['total']:>12.3f}{no_index['processo']:>15.3f}")
+        problems += [f"erro na primeira rodada sem índice: {erro}" for erro in no_index['erro']]
+
+    median = statistics.median(result['total'] for result in results)
+    print(f"\nMediana: {median:.3f}s (orçamento {args.budget:.3f}s)")
+    print(f"Sem índice: {no_index['total']:.3f}s, com {args.query_latency:.1f}s de consulta simulada (grave o índice no build da imagem)")
+    if median > args.budget:
+        problems.append(f"mediana {median:.3f}s acima do orçamento de {args.budget:.3f}s")
+
+    if problems:
+        print("\nPROBLEMAS:")
+        for problem in sorted(set(problems)):
+            print(f"  - {problem}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+# Em benchmarks/synthetic.py
+
+"""
+Gerador de dados sintéticos no formato consumido pelo core, para benchmarks em escala de produção
+(de 10 mil a 5 milhões de clientes).
+
+- generate_transactions: transações (cod_cliente, data_compra, nf_sap, volume, tipo_sku), como as
+  que get_customer_segments recebe. O número de pedidos por cliente segue uma lognormal com
+  assimetria configurável (poucos clientes com muitos pedidos, a maioria com poucos).
+- generate_segment_history: histórico de segmentos (data_snapshot, cod_cliente, categoria_*),
+  no formato da tabela RFV_ANALISE_HISTORICO.
+
+Tudo é gerado de forma vetorizada e determinística (mesma seed -> mesmos dados).
+"""
+
+import numpy as np
+import pandas as pd
+
+from core.data_loader import CATEGORY_COLUMNS
+from core.rfv_tables import get_category_table, CATEGORIA_ENTRANTE, CATEGORIA_INDEFINIDA
+
+TIPOS_SKU = ('Cápsula', 'Filtro', 'CO2')
+PESOS_SKU = (0.6, 0.25, 0.15)
+
+
+def generate_transactions(n_customers, start_date='2023-01-01', end_date='2025-06-30', mean_orders=6.0,
+                          order_skew=1.0, mean_lines_per_order=1.5, sku_weights=PESOS_SKU, seed=0):
+    """
+    Gera transações sintéticas.
+
+    Args:
+        n_customers (int): Número de clientes.
+        start_date, end_date: Período das compras.
+        mean_orders (float): Média de pedidos por cliente no período.
+        order_skew (float): Sigma da lognormal de pedidos por cliente (0 = todos iguais; maior = mais assimétrico).
+        mean_lines_per_order (float): Média de linhas (SKUs) por pedido.
+        sku_weights (tuple): Pesos de Cápsula, Filtro e CO2.
+        seed (int): Semente do gerador aleatório.
+
+    Returns:
+        pd.DataFrame: Colunas 'cod_cliente', 'data_compra', 'nf_sap', 'volume' e 'tipo_sku'.
+    """
+    rng = np.random.default_rng(seed)
+    start_ns = pd.Timestamp(start_date).value
+    span_ns = pd.Timestamp(end_date).value - start_ns
+
+    # Pedidos por cliente: lognormal com média mean_orders
+    mu = np.log(mean_orders) - order_skew**2 / 2
+    orders_per_customer = np.maximum(1, np.rint(rng.lognormal(mu, order_skew, n_customers))).astype('int64')
+    order_customer = np.repeat(np.arange(n_customers, dtype='int64'), orders_per_customer)
+    n_orders = len(order_customer)
+
+    # Cada cliente compra a partir de uma data de entrada; os pedidos ficam entre ela e o fim do período
+    entry_ns = start_ns + (rng.random(n_customers) ** 2 * span_ns).astype('int64')
+    order_entry = entry_ns[order_customer]
+    order_ns = order_entry + (rng.random(n_orders) * (start_ns + span_ns - order_entry)).astype('int64')
+    order_ns = order_ns - order_ns % (24 * 3600 * 10**9)
+
+    # Linhas de cada pedido
+    lines_per_order = 1 + rng.poisson(max(mean_lines_per_order - 1, 0), n_orders)
+    line_order = np.repeat(np.arange(n_orders, dtype='int64'), lines_per_order)
+    n_lines = len(line_order)
+
+    sku_weights = np.asarray(sku_weights, dtype=float)
+    tipo_codes = rng.choice(len(TIPOS_SKU), n_lines, p=sku_weights / sku_weights.sum())
+    volume = np.where(
+        tipo_codes == 0,
+        10 * (1 + rng.geometric(0.3, n_lines)),   # Cápsulas: caixas de 10
+        rng.integers(1, 4, n_lines),             # Filtro / CO2: poucas unidades
+    ).astype('int64')
+
+    return pd.DataFrame({
+        'cod_cliente': order_customer[line_order],
+        'data_compra': pd.to_datetime(order_ns[line_order]),
+        'nf_sap': line_order,
+        'volume': volume,
+        'tipo_sku': pd.Categorical.from_codes(tipo_codes, categories=list(TIPOS_SKU)),
+    })
+
+
+def generate_segment_history(n_customers, snapshot_dates, columns=CATEGORY_COLUMNS, churn_rate=0.03, seed=0):
+    """
+    Gera um histórico de segmentos com a estrutura de RFV_ANALISE_HISTORICO. A base cresce ao longo
+    dos snapshots e cada cliente muda de categoria com uma pequena probabilidade a cada semana.
+
+    Returns:
+        pd.DataFrame: 'data_snapshot', 'cod_cliente' e uma coluna por categoria em `columns`.
+    """
+    rng = np.random.default_rng(seed)
+    snapshot_dates = sorted(pd.to_datetime(snapshot_dates))
+    entry_step = np.minimum(rng.integers(0, len(snapshot_dates) * 2, n_customers), len(snapshot_dates) - 1)
+    entry_step[: n_customers // 2] = 0
+
+    state = {}
+    for column in columns:
+        vocabulary = [c for c in get_category_table('antigo' if column.endswith('_antigo') else 'novo').vocabulary
+                      if c not in (CATEGORIA_ENTRANTE, CATEGORIA_INDEFINIDA)]
+        state[column] = (np.asarray(vocabulary, dtype=object), rng.integers(0, len(vocabulary), n_customers))
+
+    frames = []
+    for step, snapshot_date in enumerate(snapshot_dates):
+        present = np.flatnonzero(entry_step <= step)
+        frame = {'data_snapshot': np.full(len(present), snapshot_date), 'cod_cliente': present}
+        for column, (vocabulary, codes) in state.items():
+            moves = rng.random(n_customers) < churn_rate
+            codes[moves] = rng.integers(0, len(vocabulary), int(moves.sum()))
+            frame[column] = vocabulary[codes[present]]
+        frames.append(pd.DataFrame(frame))
+    return pd.concat(frames, ignore_index=True)
@@ -1,63 +1,375 @@
 # Em core/data_loader.py (VERSÃO FINAL DE PRODUÇÃO)
+import contextvars
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 from google.cloud import bigquery
 
+from .migration_index import MigrationCellIndex
+from .segment_store import SegmentHistoryStore
+from .jobs import check_cancelled, current_job, run_in_job
+from .single_flight import SingleFlight
+from utils.logger import get_logger, log_event, span
+from .snapshot_cache import SnapshotCache, DEFAULT_CACHE_DIR
+
+logger = get_logger("rfv.data_loader")
+
 TABELA_RESUMO_ID = "bblend-data-warehouse-dev.BI_CRM.RFV_ANALISE_HISTORICO"
 
-def get_available_snapshots():
-    try:
-        client = bigquery.Client()
+# Colunas de categoria da tabela de histórico. Nomes de coluna não podem ser parâmetros de
+# query, então só nomes desta lista são interpolados no SQL.
+CATEGORY_COLUMNS = (
+    "categoria_geral_novo", "categoria_capsulas_novo", "categoria_filtro_novo", "categoria_cilindro_novo",
+    "categoria_geral_antigo", "categoria_capsulas_antigo", "categoria_insumos_antigo",
+)
+
+def validate_category_column(category_column_name):
+    if category_column_name not in CATEGORY_COLUMNS:
+        raise ValueError(f"Coluna de categoria inválida: {category_column_name!r}")
+    return category_column_name
+
+# Todas as funções aceitam um `client` opcional (qualquer objeto com .query(sql, job_config=...)
+# que retorne algo com .to_dataframe()), para permitir testes com um cliente local falso.
+# Sem ele, usam um único bigquery.Client por processo, compartilhado por todas as sessões
+# (o cliente é thread-safe e reaproveita as conexões HTTP).
+_shared_client = None
+_shared_client_lock = threading.Lock()
+
+def _get_client(client=None):
+    global _shared_client
+    if client is not None:
+        return client
+    with _shared_client_lock:
+        if _shared_client is None:
+            _shared_client = bigquery.Client()
+        return _shared_client
+
+# Queries idênticas e simultâneas de sessões diferentes compartilham uma única execução
+# (ver core/single_flight.py). Resultados que mudam pouco ficam em memória por alguns minutos.
+_single_flight = SingleFlight()
+SNAPSHOTS_TTL_SECONDS = int(os.environ.get("RFV_SNAPSHOTS_TTL_SECONDS", 300))
+MIGRATION_MATRIX_TTL_SECONDS = int(os.environ.get("RFV_MIGRATION_MATRIX_TTL_SECONDS", 3600))
+
+def _run_query(name, client, query, job_config=None):
+    """
+    Executa uma query medindo latência, linhas retornadas e bytes processados/faturados
+    (quando o cliente informa, como o QueryJob do BigQuery). Registra um log JSON por query.
+    Dentro de um job (core/jobs.py), para com JobCancelled se o job for cancelado.
+    """
+    running_job = current_job()
+    with span(f"bigquery.{name}", cache='miss') as query_span:
+        check_cancelled()
+        job = _get_client(client).query(query, job_config=job_config)
+        # Cancelar o job do app cancela a query no BigQuery (to_dataframe falha e a thread é liberada)
+        forget_cancel = running_job.on_cancel(job.cancel) if running_job is not None and hasattr(job, 'cancel') else None
+        try:
+            df = job.to_dataframe()
+        except Exception:
+            check_cancelled()  # a falha veio do cancelamento: sai como JobCancelled, não como erro
+            raise
+        finally:
+            if forget_cancel is not None:
+                forget_cancel()
+        check_cancelled()
+        query_span.set(
+            rows=len(df),
+            bytes_processed=getattr(job, 'total_bytes_processed', None),
+            bytes_billed=getattr(job, 'total_bytes_billed', None),
+            bigquery_cache_hit=getattr(job, 'cache_hit', None),
+        )
+        return df
+
+def _client_key(client):
+    return None if client is None else id(client)
+
+def clear_query_memo():
+    """Descarta os resultados guardados em memória (TTL); as próximas chamadas vão ao BigQuery/cache."""
+    _single_flight.forget()
+
+def get_query_stats():
+    """Contadores de hits, misses e coalesced por operação (para dimensionar o Cloud Run)."""
+    return _single_flight.stats()
+
+_snapshot_cache = None
+
+def get_snapshot_cache():
+    """Cache Parquet local dos snapshots (criado na primeira chamada)."""
+    global _snapshot_cache
+    if _snapshot_cache is None:
+        _snapshot_cache = SnapshotCache()
+    return _snapshot_cache
+
+# Store colunar local do histórico (ver core/segment_store.py), usado quando configurado
+SEGMENT_STORE_DIR = os.environ.get("RFV_SEGMENT_STORE_DIR")
+_segment_store = None
+
+def get_segment_store():
+    """Abre o store de segmentos de RFV_SEGMENT_STORE_DIR, se existir. Retorna None caso contrário."""
+    global _segment_store
+    if _segment_store is None and SEGMENT_STORE_DIR and os.path.isdir(SEGMENT_STORE_DIR):
+        try:
+            _segment_store = SegmentHistoryStore(SEGMENT_STORE_DIR)
+        except Exception:
+            log_event(logger, "Não foi possível abrir o store de segmentos", logging.WARNING, exc_info=True, path=SEGMENT_STORE_DIR)
+    return _segment_store
+
+def get_available_snapshots(client=None, cache=None):
+    def _query():
         query = f"SELECT DISTINCT data_snapshot FROM `{TABELA_RESUMO_ID}` ORDER BY data_snapshot DESC"
-        df = client.query(query).to_dataframe()
+        df = _run_query('get_available_snapshots', client, query)
         return pd.to_datetime(df['data_snapshot']).tolist()
-    except Exception as e:
-        print(f"ERRO em get_available_snapshots: {e}")
+
+    try:
+        snapshots = _single_flight.do('get_available_snapshots', _client_key(client), _query, ttl=SNAPSHOTS_TTL_SECONDS)
+        # Um snapshot novo invalida as entradas do cache que podem ter mudado
+        if (cache or get_snapshot_cache()).sync_snapshot_index(snapshots):
+            _single_flight.forget('get_migration_matrix')
+            _single_flight.forget('get_migration_index')
+            _single_flight.forget('refresh_net_history_cache')
+        return snapshots
+    except Exception:
+        log_event(logger, "Erro em get_available_snapshots", logging.ERROR, exc_info=True)
         return []
 
-def get_data_for_snapshot(snapshot_date):
+def get_data_for_snapshot(snapshot_date, columns=None, client=None, cache=None):
+    """
+    Retorna o snapshot de `snapshot_date`, passando pelo cache Parquet local.
+    Com `columns`, retorna só 'cod_cliente' e as colunas pedidas (lidas do Parquet por projeção).
+    """
     try:
-        client = bigquery.Client()
-        query = f"SELECT * FROM `{TABELA_RESUMO_ID}` WHERE data_snapshot = @snapshot_date"
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[ bigquery.ScalarQueryParameter("snapshot_date", "DATE", snapshot_date.date()) ]
-        )
-        df = client.query(query, job_config=job_config).to_dataframe()
-        return df
-    except Exception as e:
-        print(f"ERRO em get_data_for_snapshot para a data {snapshot_date.date()}: {e}")
+        cache = cache or get_snapshot_cache()
+        projection = None if columns is None else ['cod_cliente'] + [c for c in columns if c != 'cod_cliente']
+        with span('snapshot_cache.get', snapshot=snapshot_date.date()) as cache_span:
+            df = cache.get(snapshot_date, columns=projection)
+            cache_span.set(cache='miss' if df is None else 'hit', rows=None if df is None else len(df))
+        if df is not None:
+            _single_flight.record_hit('get_data_for_snapshot')
+            return df
+
+        def _query():
+            query = f"SELECT * FROM `{TABELA_RESUMO_ID}` WHERE data_snapshot = @snapshot_date"
+            job_config = bigquery.QueryJobConfig(
+                query_parameters=[ bigquery.ScalarQueryParameter("snapshot_date", "DATE", snapshot_date.date()) ]
+            )
+            df = _run_query('get_data_for_snapshot', client, query, job_config)
+            try:
+                cache.put(snapshot_date, df)
+            except Exception:
+                # Falha no cache (ex: disco cheio) não impede a análise
+                log_event(logger, "Não foi possível gravar o snapshot no cache", logging.WARNING, exc_info=True, snapshot=snapshot_date.date())
+            return df
+
+        key = (pd.Timestamp(snapshot_date), _client_key(client), id(cache))
+        df = _single_flight.do('get_data_for_snapshot', key, _query)
+        return df if projection is None else df[projection]
+    except Exception:
+        log_event(logger, "Erro em get_data_for_snapshot", logging.ERROR, exc_info=True, snapshot=snapshot_date.date())
         return None
 
-def get_net_history_as_df(category_column_name):
+def get_data_for_snapshots(snapshot_dates, columns=None, client=None, cache=None):
+    """
+    Busca vários snapshots em paralelo (uma thread por data), ex: Tava e Tá juntos. O tempo total
+    fica próximo ao da busca mais lenta, e não à soma das buscas.
+
+    Returns:
+        list: um DataFrame (ou None, em caso de erro) por data, na mesma ordem de snapshot_dates.
+    """
+    if not snapshot_dates:
+        return []
+    running_job = current_job()
+    with ThreadPoolExecutor(max_workers=len(snapshot_dates), thread_name_prefix="rfv-snapshot") as executor:
+        # Cada busca roda numa cópia do contexto da chamada: as spans das threads entram no trace da requisição
+        futures = [
+            executor.submit(contextvars.copy_context().run, run_in_job, running_job, get_data_for_snapshot, d, columns, client, cache)
+            for d in snapshot_dates
+        ]
+        return [future.result() for future in futures]
+
+def build_migration_matrix_query(category_column_name, table_id=TABELA_RESUMO_ID):
+    """
+    SQL da matriz de migração Tava -> Tá: outer join dos dois snapshots e GROUP BY das duas
+    categorias, tudo no servidor. Parâmetros: @data_tava e @data_ta (DATE).
+    Usa só SQL padrão (FULL OUTER JOIN, IFNULL), para rodar também em um banco local (ver
+    core/local_sql_client.py).
+    """
+    coluna = validate_category_column(category_column_name)
+    return f"""
+        WITH
+        tava AS (SELECT cod_cliente, {coluna} AS categoria FROM `{table_id}` WHERE data_snapshot = @data_tava),
+        ta AS (SELECT cod_cliente, {coluna} AS categoria FROM `{table_id}` WHERE data_snapshot = @data_ta)
+        SELECT
+          IFNULL(tava.categoria, 'ENTRANTE NA BASE') AS categoria_tava,
+          IFNULL(ta.categoria, 'CHURN') AS categoria_ta,
+          COUNT(*) AS contagem
+        FROM tava FULL OUTER JOIN ta ON tava.cod_cliente = ta.cod_cliente
+        GROUP BY 1, 2
+    """
+
+def get_migration_matrix(data_tava, data_ta, category_column_name, client=None):
+    """
+    Matriz de migração (contagem de clientes por categoria Tava x categoria Tá) calculada no
+    BigQuery: só a grade de contagens (no máximo ~10x10 linhas) é transferida, em vez de dois
+    snapshots inteiros. Mesmo resultado de pd.crosstab sobre o merge outer dos snapshots, com
+    'ENTRANTE NA BASE' para quem não estava no Tava e 'CHURN' para quem saiu no Tá.
+    Se o store de segmentos local tiver os dois snapshots, a matriz sai dele sem ir ao BigQuery.
+
+    Returns:
+        pd.DataFrame: índice 'categoria_tava', colunas 'categoria_ta'; None em caso de erro.
+    """
     try:
-        client = bigquery.Client()
-        query = f"""
-            WITH 
-            base_com_status AS (
-              SELECT data_snapshot, cod_cliente,
-                CASE WHEN {category_column_name} = 'CHURN' THEN 'Churn' ELSE 'Ativo' END AS status
-              FROM `{TABELA_RESUMO_ID}`
-              WHERE {category_column_name} != 'NOVO CLIENTE'
-            ),
-            snapshots_mensais AS (
-              SELECT DATE_TRUNC(data_snapshot, MONTH) as ano_mes, MAX(data_snapshot) as ultimo_snapshot_do_mes
-              FROM base_com_status GROUP BY 1
-            ),
-            contagem_status_mensal AS (
-              SELECT m.ano_mes, b.status, COUNT(b.cod_cliente) as contagem
-              FROM base_com_status b JOIN snapshots_mensais m ON b.data_snapshot = m.ultimo_snapshot_do_mes
-              GROUP BY 1, 2
+        query = build_migration_matrix_query(category_column_name)
+        store = get_segment_store() if client is None else None
+        if store is not None and category_column_name in store.columns and {data_tava, data_ta} <= set(store.snapshots):
+            # Os dois snapshots já estão no store local: a matriz é um bincount, sem query
+            with span('segment_store.get_migration_matrix', cache='hit', coluna=category_column_name):
+                return store.get_migration_matrix(category_column_name, data_tava, data_ta)
+
+        def _query():
+            job_config = bigquery.QueryJobConfig(
+                query_parameters=[
+                    bigquery.ScalarQueryParameter("data_tava", "DATE", data_tava.date()),
+                    bigquery.ScalarQueryParameter("data_ta", "DATE", data_ta.date()),
+                ]
             )
-            SELECT
-              ano_mes, IFNULL(Ativo, 0) as Ativo, IFNULL(Churn, 0) as Churn,
-              (IFNULL(Ativo, 0) - IFNULL(Churn, 0)) as NET
-            FROM (SELECT ano_mes, status, contagem FROM contagem_status_mensal)
-            PIVOT(SUM(contagem) FOR status IN ('Ativo', 'Churn'))
-            ORDER BY ano_mes
-        """
-        df = client.query(query).to_dataframe()
-        df['ano_mes'] = pd.to_datetime(df['ano_mes'])
-        df.set_index('ano_mes', inplace=True)
-        return df
-    except Exception as e:
-        print(f"ERRO ao calcular histórico de NET: {e}")
-        return pd.DataFrame()
\ No newline at end of file
+            df = _run_query('get_migration_matrix', client, query, job_config)
+            matriz = df.pivot_table(index='categoria_tava', columns='categoria_ta', values='contagem', aggfunc='sum', fill_value=0)
+            return matriz.astype('int64')
+
+        key = (pd.Timestamp(data_tava), pd.Timestamp(data_ta), category_column_name, _client_key(client))
+        # cache='hit' quando o resultado veio da memória ou de uma query idêntica já em andamento
+        with span('data_loader.get_migration_matrix', cache='hit', coluna=category_column_name) as matrix_span:
+            def _query_and_mark():
+                matrix_span.set(cache='miss')
+                return _query()
+            return _single_flight.do('get_migration_matrix', key, _query_and_mark, ttl=MIGRATION_MATRIX_TTL_SECONDS)
+    except Exception:
+        log_event(logger, "Erro ao calcular a matriz de migração", logging.ERROR, exc_info=True, data_tava=data_tava.date(), data_ta=data_ta.date())
+        return None
+
+def get_migration_index(data_tava, data_ta, category_column_name, client=None, cache=None):
+    """
+    Índice de drill-down da matriz (célula Tava x Tá -> cod_cliente ordenados), montado uma vez
+    por par de snapshots e mantido em memória pelo mesmo tempo da matriz. Sai do store de
+    segmentos quando ele tem as duas datas; senão, dos dois snapshots (cache Parquet / BigQuery).
+
+    Returns:
+        MigrationCellIndex (ver core/migration_index.py); None em caso de erro.
+    """
+    try:
+        validate_category_column(category_column_name)
+
+        def _build():
+            store = get_segment_store() if client is None else None
+            if store is not None and category_column_name in store.columns and {data_tava, data_ta} <= set(store.snapshots):
+                return store.get_migration_index(category_column_name, data_tava, data_ta)
+            df_tava, df_ta = get_data_for_snapshots([data_tava, data_ta], columns=[category_column_name], client=client, cache=cache)
+            if df_tava is None or df_ta is None:
+                raise RuntimeError("Não foi possível carregar os snapshots para o drill-down.")
+            model_type = 'antigo' if category_column_name.endswith('_antigo') else 'novo'
+            return MigrationCellIndex.from_snapshots(df_tava, df_ta, category_column_name, model_type)
+
+        key = (pd.Timestamp(data_tava), pd.Timestamp(data_ta), category_column_name, _client_key(client), id(cache))
+        with span('data_loader.get_migration_index', coluna=category_column_name):
+            return _single_flight.do('get_migration_index', key, _build, ttl=MIGRATION_MATRIX_TTL_SECONDS)
+    except Exception:
+        log_event(logger, "Erro ao montar o índice de drill-down", logging.ERROR, exc_info=True, data_tava=data_tava.date(), data_ta=data_ta.date())
+        return None
+
+# --- Histórico de NET (cache incremental) ---
+
+NET_HISTORY_CACHE_PATH = os.path.join(DEFAULT_CACHE_DIR, "net_history_counts.parquet")
+
+def build_snapshot_status_counts_query(columns=CATEGORY_COLUMNS, table_id=TABELA_RESUMO_ID):
+    """
+    SQL que conta, por snapshot e para todas as colunas de categoria de uma vez (uma única leitura de
+    cada linha), os clientes Ativos e em Churn, ignorando 'NOVO CLIENTE' e categorias nulas.
+    Parâmetro: @desde (DATE) - só snapshots a partir desta data. SQL padrão, roda também no
+    LocalSQLClient.
+    """
+    contagens = []
+    for column in columns:
+        coluna = validate_category_column(column)
+        contagens.append(
+            f"SUM(CASE WHEN {coluna} = 'CHURN' AND cod_cliente IS NOT NULL THEN 1 ELSE 0 END) AS {coluna}__Churn"
+        )
+        contagens.append(
+            f"SUM(CASE WHEN {coluna} NOT IN ('CHURN', 'NOVO CLIENTE') AND cod_cliente IS NOT NULL THEN 1 ELSE 0 END) AS {coluna}__Ativo"
+        )
+    contagens = ",\n              ".join(contagens)
+    return f"""
+        SELECT data_snapshot,
+              {contagens}
+        FROM `{table_id}`
+        WHERE data_snapshot >= @desde
+        GROUP BY data_snapshot
+        ORDER BY data_snapshot
+    """
+
+def _read_net_history_counts(cache_path):
+    try:
+        return pd.read_parquet(cache_path)
+    except (FileNotFoundError, OSError):
+        return None
+
+def refresh_net_history_cache(client=None, cache_path=NET_HISTORY_CACHE_PATH):
+    """
+    Atualiza o cache persistido das contagens Ativo/Churn por snapshot, para as sete colunas de
+    categoria. Só os snapshots a partir do primeiro dia do último mês em cache são consultados:
+    meses anteriores já estão fechados e não mudam. Sem cache, consulta todo o histórico.
+
+    Returns:
+        pd.DataFrame: contagens por snapshot (uma linha por data_snapshot).
+    """
+    df_cache = _read_net_history_counts(cache_path)
+    if df_cache is not None and not df_cache.empty:
+        desde = df_cache['data_snapshot'].max().to_period('M').to_timestamp()
+    else:
+        df_cache, desde = None, pd.Timestamp('1900-01-01')
+
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter("desde", "DATE", desde.date())]
+    )
+    df_new = _run_query('net_history_counts', client, build_snapshot_status_counts_query(), job_config)
+    df_new['data_snapshot'] = pd.to_datetime(df_new['data_snapshot'])
+    count_columns = [c for c in df_new.columns if c != 'data_snapshot']
+    df_new[count_columns] = df_new[count_columns].fillna(0).astype('int64')
+
+    if df_cache is not None:
+        df_new = pd.concat([df_cache[df_cache['data_snapshot'] < desde], df_new], ignore_index=True)
+
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = cache_path + ".tmp"
+    df_new.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, cache_path)
+    return df_new
+
+def _monthly_net_history(df_counts, category_column_name):
+    """Histórico mensal (último snapshot de cada mês com clientes Ativos/Churn na coluna)."""
+    df = pd.DataFrame({
+        'data_snapshot': df_counts['data_snapshot'],
+        'Ativo': df_counts[f"{category_column_name}__Ativo"],
+        'Churn': df_counts[f"{category_column_name}__Churn"],
+    })
+    df = df[(df['Ativo'] + df['Churn']) > 0]
+    df['ano_mes'] = df['data_snapshot'].dt.to_period('M').dt.to_timestamp()
+    df = df.sort_values('data_snapshot').groupby('ano_mes').tail(1).sort_values('ano_mes')
+    df['NET'] = df['Ativo'] - df['Churn']
+    return df.set_index('ano_mes')[['Ativo', 'Churn', 'NET']]
+
+def get_net_history_as_df(category_column_name, client=None, cache_path=NET_HISTORY_CACHE_PATH):
+    try:
+        category_column_name = validate_category_column(category_column_name)
+        # As sete colunas vêm do mesmo cache: cliques simultâneos (em qualquer coluna) disparam uma única atualização
+        with span('data_loader.refresh_net_history_cache', cache='hit') as refresh_span:
+            def _refresh():
+                refresh_span.set(cache='miss')
+                return refresh_net_history_cache(client=client, cache_path=cache_path)
+            df_counts = _single_flight.do('refresh_net_history_cache', (cache_path, _client_key(client)), _refresh, ttl=SNAPSHOTS_TTL_SECONDS)
+        with span('pandas.monthly_net_history', coluna=category_column_name):
+            return _monthly_net_history(df_counts, category_column_name)
+    except Exception:
+        log_event(logger, "Erro ao calcular histórico de NET", logging.ERROR, exc_info=True, coluna=category_column_name)
+        return pd.DataFrame()
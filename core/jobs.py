@@ -0,0 +1,299 @@
+# Em core/jobs.py
+
+"""
+Execução de cargas de dados em segundo plano, num pool de threads compartilhado pelo processo.
+
+Os jobs ficam guardados no JobManager (nível de processo), não na sessão: um rerun do Streamlit
+não reinicia um job que já está rodando, só volta a mostrar o progresso dele. Submeter de novo
+a mesma chave devolve o job existente (em andamento ou concluído). Por isso cada job guarda as
+sessões que o acompanham: "cancelar" numa sessão só a desliga do job (detach), e o trabalho só é
+cancelado de fato quando a última sessão sai.
+
+Cada job recebe seu objeto Job; `job.status_ui` pode ser passado como `status_ui` às funções do
+core (write / progress / warning / error), então o progresso delas aparece direto na interface.
+O cancelamento é marcado na hora (a interface para de esperar, o resultado é descartado e o job
+libera sua vaga no pool) e chega ao trabalho em andamento por dois caminhos: callbacks de
+cancelamento (ex: data_loader cancela o QueryJob do BigQuery) e check_cancelled() entre as etapas.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+
+from utils.logger import get_logger, log_event
+
+PENDENTE = "pendente"
+EXECUTANDO = "executando"
+CONCLUIDO = "concluido"
+ERRO = "erro"
+CANCELADO = "cancelado"
+
+FINISHED_JOB_TTL_SECONDS = 3600
+
+logger = get_logger("rfv.jobs")
+_current = threading.local()
+
+
+class JobCancelled(BaseException):
+    """BaseException: atravessa os `except Exception` do core, que registram erro e retornam None."""
+    pass
+
+
+def current_job():
+    """Job em execução na thread atual (None fora de um job)."""
+    return getattr(_current, 'job', None)
+
+def run_in_job(job, fn, *args, **kwargs):
+    """Executa fn(*args, **kwargs) como parte de `job` (em threads auxiliares, ex: buscas em paralelo)."""
+    previous = current_job()
+    _current.job = job
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _current.job = previous
+
+def check_cancelled():
+    """Interrompe a função se o job da thread atual foi cancelado (sem efeito fora de um job)."""
+    job = current_job()
+    if job is not None:
+        job.check_cancelled()
+
+
+class _ProgressBar:
+    """Imita a barra de status_ui.progress(): atualizações vão para o job."""
+    def __init__(self, job):
+        self._job = job
+
+    def progress(self, value, text=None):
+        self._job.set_progress(value, text)
+
+    def empty(self):
+        pass
+
+
+class JobStatusUI:
+    """Adaptador com a interface de status_ui usada em core/tava_ta_analyzer.py (write/progress/warning/error)."""
+    def __init__(self, job):
+        self._job = job
+
+    def write(self, text):
+        self._job.log(text)
+
+    def warning(self, text):
+        self._job.log(text)
+
+    def error(self, text):
+        self._job.log(text)
+
+    def progress(self, value, text=None):
+        self._job.set_progress(value, text)
+        return _ProgressBar(self._job)
+
+
+class Job:
+    def __init__(self, key, description="", params=None):
+        self.key = key
+        self.id = uuid.uuid4().hex
+        self.description = description
+        self.params = params or {}
+        self.status = PENDENTE
+        self.progress_value = 0.0
+        self.messages = []
+        self.result = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self.watchers = set()  # sessões que acompanham o job (ver JobManager.detach)
+        self.trace = None  # trace de instrumentação da execução (utils/logger.request_trace), se houver
+        self._cancel_event = threading.Event()
+        self._cancel_callbacks = []
+        self._lock = threading.Lock()
+        self.status_ui = JobStatusUI(self)
+
+    # --- Estado ---
+
+    @property
+    def done(self):
+        return self.status in (CONCLUIDO, ERRO, CANCELADO)
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def elapsed_seconds(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def cancel(self):
+        with self._lock:
+            if self.done:
+                return
+            self._cancel_event.set()
+            self.status = CANCELADO
+            self.finished_at = time.monotonic()
+            callbacks, self._cancel_callbacks = self._cancel_callbacks, []
+        for callback in callbacks:
+            self._call_cancel_callback(callback)
+
+    def on_cancel(self, callback):
+        """
+        Registra callback() para ser chamado quando o job for cancelado (na hora, se já foi).
+        Retorna uma função que desfaz o registro (ex: quando a query terminou).
+        """
+        with self._lock:
+            if not self.cancelled:
+                self._cancel_callbacks.append(callback)
+                return lambda: self._remove_cancel_callback(callback)
+        self._call_cancel_callback(callback)
+        return lambda: None
+
+    def _remove_cancel_callback(self, callback):
+        with self._lock:
+            if callback in self._cancel_callbacks:
+                self._cancel_callbacks.remove(callback)
+
+    def _call_cancel_callback(self, callback):
+        try:
+            callback()
+        except Exception:
+            log_event(logger, "Erro ao cancelar o trabalho de um job", logging.WARNING, exc_info=True, job=self.description)
+
+    def check_cancelled(self):
+        """Para ser chamada pela função do job entre etapas: interrompe se o job foi cancelado."""
+        if self.cancelled:
+            raise JobCancelled()
+
+    def set_progress(self, value, text=None):
+        with self._lock:
+            self.progress_value = max(0.0, min(1.0, float(value)))
+            if text:
+                self.messages.append(text)
+
+    def log(self, text):
+        with self._lock:
+            self.messages.append(str(text))
+
+    # --- Execução ---
+
+    def _run(self, fn):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.status = EXECUTANDO
+            self.started_at = time.monotonic()
+        _current.job = self
+        try:
+            result = fn(self)
+        except JobCancelled:
+            result = None
+        except Exception as e:
+            with self._lock:
+                if not self.cancelled:
+                    self.status = ERRO
+                    self.error = e
+                    self.finished_at = time.monotonic()
+            return
+        finally:
+            _current.job = None
+        with self._lock:
+            if not self.cancelled:
+                self.result = result
+                self.progress_value = 1.0
+                self.status = CONCLUIDO
+                self.finished_at = time.monotonic()
+
+
+class JobManager:
+    """
+    Até max_workers jobs executando ao mesmo tempo; os demais esperam na fila. Um job cancelado
+    libera a vaga na hora, mesmo que a thread dele ainda esteja terminando a etapa atual (ela
+    roda até o fim, mas não segura a fila das outras sessões).
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self._jobs = {}
+        self._pending = deque()
+        self._running = set()
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, description="", params=None, session_id=None):
+        """
+        Agenda fn(job). Se já existe um job com a mesma chave em andamento, ou concluído com
+        resultado, devolve esse job em vez de começar outro. Jobs com erro ou cancelados rodam de novo.
+        `session_id` registra a sessão que pediu o job entre as que o acompanham.
+        """
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(key)
+            if job is not None and (not job.done or (job.status == CONCLUIDO and job.result is not None)):
+                if session_id is not None:
+                    job.watchers.add(session_id)
+                return job
+            job = Job(key, description, params)
+            if session_id is not None:
+                job.watchers.add(session_id)
+            self._jobs[key] = job
+            job.on_cancel(lambda: self._release(job))
+            self._pending.append((job, fn))
+            self._start_pending()
+            return job
+
+    def detach(self, job, session_id=None):
+        """
+        Desliga uma sessão do job. O job (e a query no BigQuery) só é cancelado quando nenhuma
+        outra sessão o acompanha; retorna True nesse caso.
+        """
+        with self._lock:
+            job.watchers.discard(session_id)
+            last_watcher = not job.watchers
+        if last_watcher:
+            job.cancel()
+        return last_watcher
+
+    def _start_pending(self):
+        """Inicia jobs da fila enquanto houver vaga (chamada com self._lock)."""
+        while self._pending and len(self._running) < self.max_workers:
+            job, fn = self._pending.popleft()
+            if job.cancelled:
+                continue
+            self._running.add(job)
+            threading.Thread(target=self._run, args=(job, fn), name=f"rfv-job-{job.id[:8]}", daemon=True).start()
+
+    def _run(self, job, fn):
+        try:
+            job._run(fn)
+        finally:
+            self._release(job)
+
+    def _release(self, job):
+        with self._lock:
+            self._running.discard(job)
+            self._start_pending()
+
+    def get(self, key):
+        with self._lock:
+            return self._jobs.get(key)
+
+    def _prune(self):
+        now = time.monotonic()
+        self._jobs = {
+            key: job for key, job in self._jobs.items()
+            if not (job.done and job.finished_at is not None and now - job.finished_at > FINISHED_JOB_TTL_SECONDS)
+        }
+
+
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+def get_job_manager():
+    """JobManager único do processo (sobrevive aos reruns do Streamlit)."""
+    global _job_manager
+    with _job_manager_lock:
+        if _job_manager is None:
+            _job_manager = JobManager()
+        return _job_manager
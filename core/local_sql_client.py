@@ -0,0 +1,50 @@
+# Em core/local_sql_client.py
+
+"""
+Cliente local (SQLite) com a mesma interface mínima do bigquery.Client usada em core/data_loader.py:
+client.query(sql, job_config=...).to_dataframe().
+
+Serve para rodar as queries de SQL padrão do data_loader (ex: build_migration_matrix_query) sem
+acesso ao BigQuery: o SQLite aceita o nome da tabela entre crases e parâmetros no formato @nome.
+As datas são gravadas e comparadas como texto ISO (AAAA-MM-DD).
+
+Exemplo:
+    client = LocalSQLClient()
+    client.load_table(TABELA_RESUMO_ID, df_historico)
+    get_migration_matrix(data_tava, data_ta, 'categoria_geral_novo', client=client)
+"""
+
+import datetime
+import sqlite3
+
+import pandas as pd
+
+
+class LocalQueryJob:
+    def __init__(self, df):
+        self._df = df
+
+    def to_dataframe(self):
+        return self._df
+
+
+class LocalSQLClient:
+    def __init__(self, connection=None):
+        self.connection = connection or sqlite3.connect(":memory:", check_same_thread=False)
+
+    def load_table(self, table_id, df):
+        """Grava um DataFrame como tabela local; colunas de data viram texto ISO."""
+        df = df.copy()
+        for column in df.columns:
+            if pd.api.types.is_datetime64_any_dtype(df[column]):
+                df[column] = df[column].dt.strftime('%Y-%m-%d')
+        df.to_sql(table_id, self.connection, index=False, if_exists='replace')
+
+    def query(self, sql, job_config=None):
+        params = {}
+        for parameter in getattr(job_config, 'query_parameters', None) or []:
+            value = parameter.value
+            if isinstance(value, (datetime.date, datetime.datetime)):
+                value = value.isoformat()
+            params[parameter.name] = value
+        return LocalQueryJob(pd.read_sql_query(sql, self.connection, params=params))
@@ -0,0 +1,147 @@
+# Em core/migration_index.py
+
+"""
+Índice de drill-down da matriz de migração: de cada célula (categoria_tava, categoria_ta) para a
+lista ordenada de cod_cliente que fez aquela migração.
+
+O índice é montado uma vez por par de snapshots, junto com as contagens (que saem dele mesmo):
+os clientes ficam num único array ordenado por (célula, cod_cliente) e cada célula é uma fatia
+[início, fim) desse array (formato CSR). Buscar os clientes de uma célula, paginar ou exportar
+não recalcula nada; a exportação escreve em lotes, sem montar um DataFrame com a célula inteira.
+"""
+
+import csv
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .rfv_tables import get_category_table, CATEGORIA_CHURN, CATEGORIA_ENTRANTE
+
+DEFAULT_BATCH_SIZE = 50_000
+
+
+class MigrationCellIndex:
+    def __init__(self, customer_ids, codes_tava, codes_ta, vocabulary):
+        """
+        Args:
+            customer_ids (array): cod_cliente de cada cliente presente em pelo menos um snapshot.
+            codes_tava, codes_ta (array): código da categoria de cada cliente em cada snapshot, já
+                com ENTRANTE NA BASE / CHURN para quem não estava (índices de `vocabulary`).
+            vocabulary (sequence): nomes das categorias.
+        """
+        self.vocabulary = tuple(vocabulary)
+        self._code_of = {name: code for code, name in enumerate(self.vocabulary)}
+        n_codes = len(self.vocabulary)
+
+        customer_ids = np.asarray(customer_ids)
+        keys = np.asarray(codes_tava, dtype='int64') * n_codes + np.asarray(codes_ta, dtype='int64')
+        # Ordena por cod_cliente e depois, de forma estável, pela célula: dentro de cada célula os
+        # clientes ficam em ordem de cod_cliente
+        by_customer = np.argsort(customer_ids, kind='stable')
+        by_cell = np.argsort(keys[by_customer], kind='stable')
+        self._members = customer_ids[by_customer][by_cell]
+
+        self._counts = np.bincount(keys, minlength=n_codes * n_codes).reshape(n_codes, n_codes)
+        self._offsets = np.concatenate([[0], np.cumsum(self._counts.ravel())])
+
+    # --- Construção ---
+
+    @classmethod
+    def from_snapshots(cls, df_tava, df_ta, category_column_name, model_type):
+        """
+        Monta o índice a partir dos dois snapshots (cod_cliente + coluna de categoria), com a mesma
+        semântica de data_loader.get_migration_matrix: outer join e categoria nula/ausente vira
+        ENTRANTE NA BASE no Tava e CHURN no Tá.
+        """
+        merged = pd.merge(
+            df_tava[['cod_cliente', category_column_name]], df_ta[['cod_cliente', category_column_name]],
+            on='cod_cliente', how='outer', suffixes=('_tava', '_ta'),
+        )
+        categorias_tava = merged[f'{category_column_name}_tava'].fillna(CATEGORIA_ENTRANTE)
+        categorias_ta = merged[f'{category_column_name}_ta'].fillna(CATEGORIA_CHURN)
+
+        vocabulary = list(get_category_table(model_type).vocabulary)
+        vocabulary += sorted((set(categorias_tava) | set(categorias_ta)) - set(vocabulary))
+        return cls(
+            merged['cod_cliente'].to_numpy(),
+            pd.Categorical(categorias_tava, categories=vocabulary).codes,
+            pd.Categorical(categorias_ta, categories=vocabulary).codes,
+            vocabulary,
+        )
+
+    # --- Consulta ---
+
+    def _cell_bounds(self, categoria_tava, categoria_ta):
+        code_tava, code_ta = self._code_of.get(categoria_tava), self._code_of.get(categoria_ta)
+        if code_tava is None or code_ta is None:
+            return 0, 0
+        cell = code_tava * len(self.vocabulary) + code_ta
+        return int(self._offsets[cell]), int(self._offsets[cell + 1])
+
+    def count(self, categoria_tava, categoria_ta):
+        start, end = self._cell_bounds(categoria_tava, categoria_ta)
+        return end - start
+
+    def get_customers(self, categoria_tava, categoria_ta, offset=0, limit=None):
+        """cod_cliente (ordenados) da célula, da posição `offset` em diante (até `limit` clientes)."""
+        start, end = self._cell_bounds(categoria_tava, categoria_ta)
+        start = min(start + offset, end)
+        if limit is not None:
+            end = min(start + limit, end)
+        return self._members[start:end]
+
+    def iter_customers(self, categoria_tava, categoria_ta, batch_size=DEFAULT_BATCH_SIZE):
+        """Percorre os clientes da célula em lotes de até batch_size (fatias do índice, sem cópia)."""
+        start, end = self._cell_bounds(categoria_tava, categoria_ta)
+        for batch_start in range(start, end, batch_size):
+            yield self._members[batch_start:min(batch_start + batch_size, end)]
+
+    def get_matrix(self):
+        """Contagens por célula, no formato de data_loader.get_migration_matrix."""
+        rows, cols = self._counts.sum(axis=1) > 0, self._counts.sum(axis=0) > 0
+        vocabulary = np.asarray(self.vocabulary, dtype=object)
+        return pd.DataFrame(
+            self._counts[np.ix_(rows, cols)],
+            index=pd.Index(vocabulary[rows], name='categoria_tava'),
+            columns=pd.Index(vocabulary[cols], name='categoria_ta'),
+        )
+
+
+# --- Exportação em Lotes ---
+
+def export_cell_csv(index, categoria_tava, categoria_ta, path_or_buffer, batch_size=DEFAULT_BATCH_SIZE):
+    """Grava os clientes da célula em CSV (coluna cod_cliente), lote a lote. Retorna o número de linhas."""
+    def _write(f):
+        writer = csv.writer(f)
+        writer.writerow(['cod_cliente'])
+        n_rows = 0
+        for batch in index.iter_customers(categoria_tava, categoria_ta, batch_size):
+            writer.writerows((customer,) for customer in batch)
+            n_rows += len(batch)
+        return n_rows
+
+    if hasattr(path_or_buffer, 'write'):
+        return _write(path_or_buffer)
+    with open(path_or_buffer, 'w', newline='', encoding='utf-8') as f:
+        return _write(f)
+
+def export_cell_parquet(index, categoria_tava, categoria_ta, path, batch_size=DEFAULT_BATCH_SIZE):
+    """Grava os clientes da célula em Parquet, um row group por lote. Retorna o número de linhas."""
+    writer = None
+    n_rows = 0
+    try:
+        for batch in index.iter_customers(categoria_tava, categoria_ta, batch_size):
+            table = pa.table({'cod_cliente': pa.array(batch)})
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            n_rows += len(batch)
+        if writer is None:
+            # Célula vazia: arquivo só com o esquema
+            pq.write_table(pa.table({'cod_cliente': pa.array([], type=pa.string())}), path)
+    finally:
+        if writer is not None:
+            writer.close()
+    return n_rows
@@ -1,10 +1,12 @@
 # Em core/rfv_calculator.py
 
+import numpy as np
 import pandas as pd
 from datetime import datetime
 # Importamos as regras que definimos no arquivo anterior
 # O '.' antes de rfv_rules indica que é um import relativo, dentro do mesmo pacote 'core'
 from .rfv_rules import RFV_RULES_ANTIGO, RFV_RULES_NOVO
+from .rfv_tables import get_compiled_rules
 
 # --- Função Auxiliar de Pontuação ---
 
@@ -87,6 +89,231 @@ def calculate_customer_rfv(df_customer_product_transactions, analysis_date, rule
         'Total_score': total_score
     }
 
+# --- Cálculo em Lote (toda a base de uma vez) ---
+
+def calculate_rfv_batch(df_product_transactions, analysis_date, rules_config):
+    """
+    Calcula R, F e V para TODOS os clientes de uma vez, com um único groupby vetorizado.
+    O resultado é idêntico a chamar calculate_customer_rfv cliente a cliente, que continua
+    disponível como referência (oráculo) para validar este caminho.
+
+    Args:
+        df_product_transactions (pd.DataFrame): Transações do tipo de produto analisado,
+            com as colunas 'cod_cliente', 'data_compra', 'nf_sap' e 'volume'.
+        analysis_date (datetime): A data de referência para o cálculo.
+        rules_config (dict): O dicionário de regras para o tipo de produto.
+
+    Returns:
+        pd.DataFrame: Indexado por 'cod_cliente' (na ordem de aparição), com as mesmas colunas
+            retornadas por calculate_customer_rfv.
+    """
+    analysis_date = pd.to_datetime(analysis_date)
+    start_date = analysis_date - pd.Timedelta(days=365)
+
+    all_customer_ids = pd.Index(df_product_transactions['cod_cliente'].unique(), name='cod_cliente')
+    in_period = (
+        (df_product_transactions['data_compra'] >= start_date) &
+        (df_product_transactions['data_compra'] <= analysis_date)
+    )
+    grouped = df_product_transactions.loc[in_period].groupby('cod_cliente', sort=False)
+
+    last_purchase_date = grouped['data_compra'].max().reindex(all_customer_ids)
+    frequency = grouped['nf_sap'].nunique().reindex(all_customer_ids, fill_value=0)
+    volume = grouped['volume'].sum().reindex(all_customer_ids, fill_value=0)
+
+    # A recência é contada em dias de calendário, como em calculate_customer_rfv (.date()).
+    # Clientes sem transações na janela ficam com recência -1 e F/V zerados (scores 0).
+    recency_days = (analysis_date.normalize() - last_purchase_date.dt.normalize()).dt.days
+    recency_days = recency_days.fillna(-1).astype('int64')
+
+    return _build_rfv_frame(all_customer_ids, recency_days.to_numpy(), frequency.to_numpy(), volume.to_numpy(), rules_config)
+
+def _build_rfv_frame(customer_ids, recency_days, frequency, volume, rules_config):
+    """Pontua arrays de R, F e V já calculados e monta o DataFrame no formato de calculate_customer_rfv."""
+    tables = get_compiled_rules(rules_config)
+    df_rfv = pd.DataFrame({
+        'recency_days': np.asarray(recency_days).astype('int64'),
+        'frequency': np.asarray(frequency).astype('int64'),
+        'volume': np.asarray(volume).astype('int64'),
+        'R_score': tables['R'].score(recency_days),
+        'F_score': tables['F'].score(frequency),
+        'V_score': tables['V'].score(volume),
+    }, index=customer_ids)
+    df_rfv['Total_score'] = df_rfv['R_score'] + df_rfv['F_score'] + df_rfv['V_score']
+    return df_rfv
+
+def score_rfv_metrics(df_metrics, rules_config):
+    """
+    Pontua valores brutos de R, F e V já calculados (colunas 'recency_days', 'frequency' e
+    'volume') com as regras de um tipo de produto, no formato de calculate_rfv_batch.
+    """
+    return _build_rfv_frame(
+        df_metrics.index, df_metrics['recency_days'].to_numpy(), df_metrics['frequency'].to_numpy(),
+        df_metrics['volume'].to_numpy(), rules_config
+    )
+
+# --- Cálculo de Vários Focos (um único agrupamento) ---
+
+NS_PER_DAY = 24 * 60 * 60 * 10**9
+
+def calculate_rfv_metrics_by_focus(df_transactions, analysis_date, focus_skus):
+    """
+    Calcula os valores brutos de R, F e V de vários focos (conjuntos de tipo_sku) com um único
+    filtro de janela e um único agrupamento por cliente e tipo_sku. Os agregados de cada tipo_sku
+    (última compra, volume, pedidos) são combinados para formar os de cada foco; um pedido com
+    SKUs de mais de um tipo conta uma vez só no foco que junta esses tipos (ex: Insumos).
+
+    Args:
+        df_transactions (pd.DataFrame): Todas as transações (todos os tipos de SKU), com as colunas
+            'cod_cliente', 'tipo_sku', 'data_compra', 'nf_sap' e 'volume'.
+        analysis_date (datetime): A data de referência para o cálculo.
+        focus_skus (dict): Foco -> lista de tipo_sku (ex: {'Insumos': ['Filtro', 'CO2']}).
+
+    Returns:
+        dict: Foco -> pd.DataFrame indexado por 'cod_cliente' (todos os clientes, na ordem de
+            aparição) com 'recency_days', 'frequency' e 'volume'. Pontuado com score_rfv_metrics,
+            é idêntico a calculate_rfv_batch nas transações do foco (clientes sem compras do foco
+            ficam com recência -1 e F/V zerados).
+    """
+    analysis_date = pd.to_datetime(analysis_date)
+    start_ns = (analysis_date - pd.Timedelta(days=365)).value
+    analysis_ns = analysis_date.value
+
+    customer_codes, customer_ids = pd.factorize(df_transactions['cod_cliente'])
+    customer_ids = pd.Index(customer_ids, name='cod_cliente')
+    n_customers = len(customer_ids)
+
+    sku_names = list(dict.fromkeys(sku for skus in focus_skus.values() for sku in skus))
+    n_skus = len(sku_names)
+    sku_codes = pd.Categorical(df_transactions['tipo_sku'], categories=sku_names).codes.astype('int64')
+
+    purchase_ns = df_transactions['data_compra'].to_numpy(dtype='datetime64[ns]').view('int64')
+    rows = (sku_codes >= 0) & (purchase_ns >= start_ns) & (purchase_ns <= analysis_ns)
+    customers = customer_codes[rows].astype('int64')
+    skus = sku_codes[rows]
+    purchase_ns = purchase_ns[rows]
+
+    # Agregados por (cliente, tipo_sku)
+    cell = customers * n_skus + skus
+    last_purchase_ns = np.full(n_customers * n_skus, np.iinfo('int64').min, dtype='int64')
+    np.maximum.at(last_purchase_ns, cell, purchase_ns)
+    last_purchase_ns = last_purchase_ns.reshape(n_customers, n_skus)
+    volumes = df_transactions['volume'].fillna(0).to_numpy()[rows].astype('float64')
+    volume = np.bincount(cell, weights=volumes, minlength=n_customers * n_skus).reshape(n_customers, n_skus)
+
+    # Pedidos distintos: trincas (cliente, nf_sap, tipo_sku). nf_sap nulo não conta, como em nunique().
+    nf_codes, nf_uniques = pd.factorize(df_transactions['nf_sap'].to_numpy()[rows])
+    has_order = nf_codes >= 0
+    order_keys = customers[has_order] * len(nf_uniques) + nf_codes[has_order]
+    triples = np.unique(order_keys * n_skus + skus[has_order])
+    triple_orders, triple_skus = triples // n_skus, triples % n_skus
+
+    metrics = {}
+    for focus, focus_sku_names in focus_skus.items():
+        focus_sku_codes = [sku_names.index(sku) for sku in focus_sku_names]
+        focus_last_ns = last_purchase_ns[:, focus_sku_codes].max(axis=1)
+        in_window = focus_last_ns >= start_ns
+
+        focus_orders = triple_orders[np.isin(triple_skus, focus_sku_codes)]
+        if len(focus_sku_codes) > 1:
+            focus_orders = np.unique(focus_orders)
+        frequency = np.bincount(focus_orders // len(nf_uniques), minlength=n_customers) if len(nf_uniques) else np.zeros(n_customers, dtype='int64')
+
+        metrics[focus] = pd.DataFrame({
+            'recency_days': np.where(in_window, analysis_ns // NS_PER_DAY - focus_last_ns // NS_PER_DAY, -1),
+            'frequency': frequency.astype('int64'),
+            # Volume mantido como soma exata (float): a pontuação usa o valor antes do truncamento
+            'volume': volume[:, focus_sku_codes].sum(axis=1),
+        }, index=customer_ids)
+    return metrics
+
+# --- Cálculo em Várias Datas (uma única varredura) ---
+
+def calculate_rfv_multi_date(df_product_transactions, analysis_dates, rules_config):
+    """
+    Calcula R, F e V para todos os clientes em várias datas de análise com UMA varredura das
+    transações em ordem de data. Uma janela deslizante de 365 dias mantém, por cliente, a última
+    compra, os pedidos distintos e o volume: a cada data, só as transações que entraram ou saíram
+    da janela desde a data anterior são processadas. O custo total fica próximo de uma passada
+    pelos dados, em vez de uma passada por data.
+
+    Args:
+        df_product_transactions (pd.DataFrame): Mesmas colunas de calculate_rfv_batch.
+        analysis_dates (list): Datas de análise (em qualquer ordem; são processadas em ordem crescente).
+        rules_config (dict): O dicionário de regras para o tipo de produto.
+
+    Yields:
+        tuple: (analysis_date, pd.DataFrame) em ordem crescente de data; cada DataFrame é
+            idêntico ao retornado por calculate_rfv_batch para aquela data.
+    """
+    customer_codes, customer_ids = pd.factorize(df_product_transactions['cod_cliente'])
+    customer_ids = pd.Index(customer_ids, name='cod_cliente')
+    n_customers = len(customer_ids)
+
+    # Ordena as transações por data uma única vez (ordenação estável)
+    purchase_ns = df_product_transactions['data_compra'].to_numpy(dtype='datetime64[ns]').view('int64')
+    order = np.argsort(purchase_ns, kind='stable')
+    purchase_ns = purchase_ns[order]
+    customer_codes = customer_codes[order]
+
+    # Pedidos distintos: contamos quantas linhas de cada par (cliente, nf_sap) estão na janela.
+    # nf_sap nulo não conta como pedido, como em nunique().
+    nf_codes, nf_uniques = pd.factorize(df_product_transactions['nf_sap'].to_numpy()[order])
+    has_order = nf_codes >= 0
+    pair_codes, pair_uniques = pd.factorize(customer_codes.astype('int64') * (len(nf_uniques) + 1) + nf_codes + 1)
+    pair_customer = np.zeros(len(pair_uniques), dtype='int64')
+    pair_customer[pair_codes] = customer_codes
+
+    # Volumes inteiros são somados em int64 (soma exata ao entrar e sair da janela)
+    volumes = df_product_transactions['volume'].fillna(0).to_numpy()[order]
+    if np.all(np.mod(volumes, 1) == 0):
+        volumes = volumes.astype('int64')
+
+    pair_count = np.zeros(len(pair_uniques), dtype='int64')
+    frequency = np.zeros(n_customers, dtype='int64')
+    volume = np.zeros(n_customers, dtype=volumes.dtype)
+    last_purchase_ns = np.full(n_customers, np.iinfo('int64').min, dtype='int64')
+
+    def _update_orders(rows, delta):
+        rows = rows[has_order[rows]]
+        pairs, counts = np.unique(pair_codes[rows], return_counts=True)
+        if delta > 0:
+            opened = pairs[pair_count[pairs] == 0]
+            np.add.at(frequency, pair_customer[opened], 1)
+            pair_count[pairs] += counts
+        else:
+            pair_count[pairs] -= counts
+            closed = pairs[pair_count[pairs] == 0]
+            np.subtract.at(frequency, pair_customer[closed], 1)
+
+    window_low, window_high = 0, 0
+    for analysis_date in sorted(pd.to_datetime(d) for d in analysis_dates):
+        analysis_ns = analysis_date.value
+        start_ns = (analysis_date - pd.Timedelta(days=365)).value
+        new_low = max(np.searchsorted(purchase_ns, start_ns, side='left'), window_low)
+        new_high = max(np.searchsorted(purchase_ns, analysis_ns, side='right'), window_high)
+
+        # Entradas primeiro, depois saídas: cada transação entra e sai da janela uma única vez
+        entering = np.arange(window_high, new_high)
+        leaving = np.arange(window_low, new_low)
+        np.add.at(volume, customer_codes[entering], volumes[entering])
+        np.maximum.at(last_purchase_ns, customer_codes[entering], purchase_ns[entering])
+        _update_orders(entering, +1)
+        np.subtract.at(volume, customer_codes[leaving], volumes[leaving])
+        _update_orders(leaving, -1)
+        window_low, window_high = new_low, new_high
+
+        # A última compra é a maior data já vista; só vale se ainda estiver dentro da janela
+        in_window = last_purchase_ns >= start_ns
+        recency_days = np.where(
+            in_window,
+            analysis_ns // NS_PER_DAY - last_purchase_ns // NS_PER_DAY,
+            -1,
+        )
+        yield analysis_date, _build_rfv_frame(
+            customer_ids, recency_days, np.where(in_window, frequency, 0), np.where(in_window, volume, 0), rules_config
+        )
+
 # --- Bloco de Teste ---
 # Este bloco só executa quando você roda o script diretamente (ex: python core/rfv_calculator.py)
 # É ótimo para verificar se a lógica está correta sem precisar rodar o app Streamlit inteiro.
@@ -0,0 +1,368 @@
+# Em core/rfv_state.py
+
+"""
+Estado incremental de RFV por cliente, persistido em disco, para o cálculo diário.
+
+Em vez de reagregar a janela de 365 dias de todos os clientes a cada data de análise, o estado
+guarda por cliente e foco a última compra, os pedidos distintos e o volume dentro da janela, e por
+cliente a data da primeira compra (regra de NOVO CLIENTE). Aplicar um dia novo (apply) soma as
+transações que entraram e subtrai as que saíram da janela, mexendo só nos clientes afetados.
+Os agregados por cliente custam O(transações novas + expiradas); os arrays de pares (abaixo) e a
+gravação da nova versão custam O(pares na janela) por apply, mas são cópias sequenciais de
+memória/disco, sem reagregar o histórico (ex: 3 milhões de pares e 10 mil novos e expirados
+num foco: ~0,1 s entre add, remove e gravação).
+
+Estrutura em disco (um diretório):
+    meta.json            -> data do estado, focos, lotes de transações ainda na janela
+    state_<data>/        -> arrays NumPy do estado (um diretório por versão; meta.json aponta a atual)
+    batches/<dia>_<data>.parquet -> transações da janela (com a chave do pedido), por dia de compra
+                                    e apply; relidas só quando expiram
+
+Pedidos distintos: cada par (cliente, nf_sap) de um foco vira uma chave de 64 bits (hash estável)
+com o número de linhas na janela; o pedido conta enquanto a contagem for positiva, como em
+calculate_rfv_multi_date. As chaves ficam num array ordenado (busca por searchsorted): pares novos
+entram com np.insert e pares fechados saem com uma máscara, e cada um copia os arrays de pares.
+O modo de verificação (verify) compara o estado com o recálculo completo.
+"""
+
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from .rfv_calculator import NS_PER_DAY, calculate_rfv_metrics_by_focus, score_rfv_metrics
+from .rfv_rules import RFV_RULES_ANTIGO, RFV_RULES_NOVO
+from .tava_ta_analyzer import FOCUS_COLUMNS, SKU_MAP, _build_segments, get_customer_segments
+from utils.logger import get_logger, log_event, span
+
+META_FILE_NAME = "meta.json"
+BATCHES_DIR_NAME = "batches"
+CUSTOMERS_FILE_NAME = "customers.parquet"
+WINDOW = pd.Timedelta(days=365)
+SEM_COMPRA = np.iinfo('int64').min
+SEM_PRIMEIRA_COMPRA = np.iinfo('int64').max
+
+logger = get_logger("rfv.state")
+
+
+def _stamp(analysis_date):
+    return pd.Timestamp(analysis_date).strftime('%Y%m%dT%H%M%S')
+
+def _nf_sap_text(nf_sap):
+    """
+    nf_sap como texto, igual qualquer que seja o tipo da coluna: o hash depende do dtype, e a mesma
+    nota pode chegar como int64, object (ints com None) ou float64 (ints com NaN) -> sempre '123'.
+    """
+    values = pd.Series(nf_sap)
+    if values.dtype.kind == 'f' and (values.dropna() % 1 == 0).all():
+        values = values.astype('Int64')
+    return values.astype(str).to_numpy()
+
+def _pair_keys(customer_codes, nf_sap):
+    """Chave de 64 bits estável para cada par (cliente, nf_sap). Linhas com nf_sap nulo não são pedidos."""
+    return pd.util.hash_pandas_object(
+        pd.DataFrame({'cliente': customer_codes, 'nf_sap': _nf_sap_text(nf_sap)}), index=False
+    ).to_numpy()
+
+
+class _FocusState:
+    """
+    Agregados de um foco: arrays por cliente e pares (cliente, nf_sap) ordenados por chave. add e
+    remove copiam os arrays de pares quando algum par entra ou sai: O(pares na janela) por chamada.
+    """
+
+    ARRAYS = ('last_purchase_ns', 'volume', 'frequency', 'pair_keys', 'pair_counts', 'pair_customers')
+
+    def __init__(self, arrays):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def empty(cls):
+        return cls({
+            'last_purchase_ns': np.zeros(0, dtype='int64'), 'volume': np.zeros(0, dtype='float64'),
+            'frequency': np.zeros(0, dtype='int64'), 'pair_keys': np.zeros(0, dtype='uint64'),
+            'pair_counts': np.zeros(0, dtype='int64'), 'pair_customers': np.zeros(0, dtype='int64'),
+        })
+
+    def grow(self, n_customers):
+        extra = n_customers - len(self.last_purchase_ns)
+        if extra > 0:
+            self.last_purchase_ns = np.concatenate([self.last_purchase_ns, np.full(extra, SEM_COMPRA, dtype='int64')])
+            self.volume = np.concatenate([self.volume, np.zeros(extra, dtype='float64')])
+            self.frequency = np.concatenate([self.frequency, np.zeros(extra, dtype='int64')])
+
+    def add(self, customers, purchase_ns, volumes, pair_keys, has_order):
+        np.maximum.at(self.last_purchase_ns, customers, purchase_ns)
+        np.add.at(self.volume, customers, volumes)
+
+        keys, first_row, counts = np.unique(pair_keys[has_order], return_index=True, return_counts=True)
+        key_customers = customers[has_order][first_row]
+        positions = np.searchsorted(self.pair_keys, keys)
+        found = positions < len(self.pair_keys)
+        found[found] = self.pair_keys[positions[found]] == keys[found]
+        np.add.at(self.pair_counts, positions[found], counts[found])
+
+        # Pares novos: entram ordenados no array de chaves e abrem um pedido para o cliente
+        new = ~found
+        np.add.at(self.frequency, key_customers[new], 1)
+        if not new.any():
+            return
+        insert_at = positions[new]
+        self.pair_keys = np.insert(self.pair_keys, insert_at, keys[new])
+        self.pair_counts = np.insert(self.pair_counts, insert_at, counts[new])
+        self.pair_customers = np.insert(self.pair_customers, insert_at, key_customers[new])
+
+    def remove(self, customers, volumes, pair_keys, has_order):
+        np.subtract.at(self.volume, customers, volumes)
+
+        keys, counts = np.unique(pair_keys[has_order], return_counts=True)
+        positions = np.searchsorted(self.pair_keys, keys)
+        if len(keys) and (positions.max() >= len(self.pair_keys) or np.any(self.pair_keys[positions] != keys)):
+            raise RuntimeError("Estado de RFV inconsistente: pedido expirado que não estava na janela.")
+        self.pair_counts[positions] -= counts
+
+        # Pares que zeraram fecham um pedido do cliente e saem do array
+        closed = positions[self.pair_counts[positions] == 0]
+        np.subtract.at(self.frequency, self.pair_customers[closed], 1)
+        if not len(closed):
+            return
+        keep = np.ones(len(self.pair_keys), dtype=bool)
+        keep[closed] = False
+        self.pair_keys, self.pair_counts, self.pair_customers = self.pair_keys[keep], self.pair_counts[keep], self.pair_customers[keep]
+
+
+class RFVStateStore:
+    def __init__(self, path):
+        self.path = path
+        self._load()
+
+    # --- Persistência ---
+
+    @classmethod
+    def create(cls, path):
+        """Cria um estado vazio. O primeiro apply (com o histórico inteiro) faz a carga inicial."""
+        os.makedirs(os.path.join(path, BATCHES_DIR_NAME), exist_ok=True)
+        if os.path.exists(os.path.join(path, META_FILE_NAME)):
+            raise ValueError(f"Já existe um estado de RFV em {path}.")
+        cls._write_meta(path, {'as_of': None, 'state_dir': None, 'focuses': SKU_MAP, 'focus_has_rows': {}, 'batches': []})
+        return cls(path)
+
+    @staticmethod
+    def _write_meta(path, meta):
+        tmp_path = os.path.join(path, META_FILE_NAME + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(path, META_FILE_NAME))
+
+    def _load(self):
+        with open(os.path.join(self.path, META_FILE_NAME)) as f:
+            self._meta = json.load(f)
+        if self._meta['focuses'] != SKU_MAP:
+            raise ValueError("Os focos (SKU_MAP) mudaram desde a criação do estado: recrie o estado com o histórico completo.")
+        self.as_of = None if self._meta['as_of'] is None else pd.Timestamp(self._meta['as_of'])
+        self.focus_types = list(self._meta['focuses'])
+
+        state_dir = self._meta['state_dir']
+        if state_dir is None:
+            self.customers = pd.Index([], name='cod_cliente')
+            self.first_purchase_ns = np.zeros(0, dtype='int64')
+            self._focus = {focus: _FocusState.empty() for focus in self.focus_types}
+            return
+        state_path = os.path.join(self.path, state_dir)
+        self.customers = pd.Index(pd.read_parquet(os.path.join(state_path, CUSTOMERS_FILE_NAME))['cod_cliente'], name='cod_cliente')
+        self.first_purchase_ns = np.load(os.path.join(state_path, "first_purchase_ns.npy"))
+        self._focus = {
+            focus: _FocusState({name: np.load(os.path.join(state_path, f"{i}_{name}.npy")) for name in _FocusState.ARRAYS})
+            for i, focus in enumerate(self.focus_types)
+        }
+
+    def _save(self, analysis_date, batches, focus_has_rows):
+        """Grava uma nova versão do estado e troca meta.json por último (a versão anterior continua válida até lá)."""
+        state_dir = f"state_{_stamp(analysis_date)}"
+        state_path = os.path.join(self.path, state_dir)
+        os.makedirs(state_path, exist_ok=True)
+        pd.DataFrame({'cod_cliente': self.customers}).to_parquet(os.path.join(state_path, CUSTOMERS_FILE_NAME), index=False)
+        np.save(os.path.join(state_path, "first_purchase_ns.npy"), self.first_purchase_ns)
+        for i, focus in enumerate(self.focus_types):
+            for name in _FocusState.ARRAYS:
+                np.save(os.path.join(state_path, f"{i}_{name}.npy"), getattr(self._focus[focus], name))
+
+        previous_dir = self._meta['state_dir']
+        meta = dict(self._meta, as_of=pd.Timestamp(analysis_date).isoformat(), state_dir=state_dir, batches=batches, focus_has_rows=focus_has_rows)
+        self._write_meta(self.path, meta)
+        self._meta = meta
+        if previous_dir and previous_dir != state_dir:
+            shutil.rmtree(os.path.join(self.path, previous_dir), ignore_errors=True)
+
+    # --- Atualização ---
+
+    def _customer_codes(self, cod_cliente):
+        """Códigos dos clientes no estado, acrescentando os novos (na ordem de aparição)."""
+        codes = self.customers.get_indexer(cod_cliente)
+        new = codes < 0
+        if new.any():
+            new_customers = pd.Index(pd.unique(cod_cliente[new]), name='cod_cliente')
+            self.customers = self.customers.append(new_customers) if len(self.customers) else new_customers
+            self.first_purchase_ns = np.concatenate([self.first_purchase_ns, np.full(len(new_customers), SEM_PRIMEIRA_COMPRA, dtype='int64')])
+            codes[new] = self.customers.get_indexer(cod_cliente[new])
+        return codes
+
+    def _apply_rows(self, df_rows, customers, sign):
+        purchase_ns = df_rows['data_compra'].to_numpy(dtype='datetime64[ns]').view('int64')
+        volumes = df_rows['volume'].fillna(0).to_numpy(dtype='float64')
+        pair_keys = df_rows['pair_key'].to_numpy(dtype='uint64')
+        has_order = df_rows['has_order'].to_numpy(dtype=bool)
+        tipo_sku = df_rows['tipo_sku'].to_numpy()
+        for focus in self.focus_types:
+            rows = np.isin(tipo_sku, SKU_MAP[focus])
+            state = self._focus[focus]
+            state.grow(len(self.customers))
+            if sign > 0:
+                state.add(customers[rows], purchase_ns[rows], volumes[rows], pair_keys[rows], has_order[rows])
+            else:
+                state.remove(customers[rows], volumes[rows], pair_keys[rows], has_order[rows])
+
+    def apply(self, analysis_date, df_new_transactions, verify_with=None):
+        """
+        Avança o estado para analysis_date com as transações novas (data_compra depois da data do
+        estado anterior e até analysis_date). Na primeira chamada, passe o histórico inteiro.
+
+        Args:
+            verify_with (pd.DataFrame): Opcional. Histórico completo até analysis_date; se passado,
+                o resultado é comparado com o recálculo completo (ver verify).
+
+        Returns:
+            pd.DataFrame ou None: o relatório de verify, quando verify_with é passado.
+
+        Raises:
+            ValueError: Data anterior à do estado, ou transações fora de (data anterior, analysis_date].
+        """
+        analysis_date = pd.Timestamp(analysis_date)
+        if self.as_of is not None and analysis_date <= self.as_of:
+            raise ValueError(f"O estado já está em {self.as_of}; datas devem avançar.")
+        purchase_dates = pd.to_datetime(df_new_transactions['data_compra'])
+        if (purchase_dates > analysis_date).any() or (self.as_of is not None and (purchase_dates <= self.as_of).any()):
+            raise ValueError("Transações fora do intervalo do apply: recrie o estado com o histórico completo.")
+
+        with span('rfv_state.apply', data=analysis_date.date(), novas=len(df_new_transactions)) as apply_span:
+            columns = ['cod_cliente', 'tipo_sku', 'data_compra', 'nf_sap', 'volume']
+            df_new = df_new_transactions[columns].reset_index(drop=True)
+            df_new['data_compra'] = purchase_dates.to_numpy()
+            previous_start = None if self.as_of is None else self.as_of - WINDOW
+            new_start = analysis_date - WINDOW
+
+            # Todas as transações contam para a primeira compra; só as que estão na janela entram nos agregados
+            customers = self._customer_codes(df_new['cod_cliente'].to_numpy())
+            np.minimum.at(self.first_purchase_ns, customers, purchase_dates.to_numpy(dtype='datetime64[ns]').view('int64'))
+            in_window = (purchase_dates >= new_start).to_numpy()
+            # A chave do pedido é calculada uma vez e gravada no lote: na expiração ela é lida, não
+            # recalculada (a ida e volta pelo Parquet pode mudar o tipo de nf_sap)
+            df_window = df_new[in_window].drop(columns='nf_sap').assign(
+                pair_key=_pair_keys(customers[in_window], df_new['nf_sap'].to_numpy()[in_window]),
+                has_order=df_new['nf_sap'].notna().to_numpy()[in_window],
+            )
+            self._apply_rows(df_window, customers[in_window], +1)
+
+            # Expiram as transações dos lotes anteriores com data em [início da janela anterior, início da nova)
+            batches = []
+            n_expired = 0
+            for batch in self._meta['batches']:
+                if pd.Timestamp(batch['min']) < new_start:
+                    df_batch = pd.read_parquet(os.path.join(self.path, batch['file']))
+                    expiring = (df_batch['data_compra'] >= previous_start) & (df_batch['data_compra'] < new_start)
+                    df_expired = df_batch[expiring.to_numpy()]
+                    self._apply_rows(df_expired, self.customers.get_indexer(df_expired['cod_cliente']), -1)
+                    n_expired += len(df_expired)
+                batches.append(batch)
+            apply_span.set(expiradas=n_expired, clientes=len(self.customers))
+
+            # Lotes gravados por dia de compra: a expiração de um dia lê só os arquivos daquele dia
+            for day, df_day in df_window.groupby(df_window['data_compra'].dt.normalize()):
+                batch_file = os.path.join(BATCHES_DIR_NAME, f"{day:%Y%m%d}_{_stamp(analysis_date)}.parquet")
+                df_day.to_parquet(os.path.join(self.path, batch_file), index=False)
+                batches.append({'file': batch_file, 'min': df_day['data_compra'].min().isoformat(), 'max': df_day['data_compra'].max().isoformat()})
+
+            focus_has_rows = dict(self._meta['focus_has_rows'])
+            for focus in self.focus_types:
+                focus_has_rows[focus] = bool(focus_has_rows.get(focus)) or bool(df_new['tipo_sku'].isin(SKU_MAP[focus]).any())
+            expired_batches = [batch for batch in batches if pd.Timestamp(batch['max']) < new_start]
+            self.as_of = analysis_date
+            self._save(analysis_date, [batch for batch in batches if batch not in expired_batches], focus_has_rows)
+            for batch in expired_batches:
+                try:
+                    os.remove(os.path.join(self.path, batch['file']))
+                except FileNotFoundError:
+                    pass
+
+        if verify_with is not None:
+            return self.verify(verify_with)
+        return None
+
+    # --- Leitura ---
+
+    def get_metrics(self, focus_type):
+        """Valores brutos de R, F e V do foco na data do estado, no formato de calculate_rfv_metrics_by_focus."""
+        state = self._focus[focus_type]
+        state.grow(len(self.customers))
+        analysis_ns = self.as_of.value
+        in_window = state.last_purchase_ns >= (self.as_of - WINDOW).value
+        return pd.DataFrame({
+            'recency_days': np.where(in_window, analysis_ns // NS_PER_DAY - state.last_purchase_ns // NS_PER_DAY, -1),
+            'frequency': np.where(in_window, state.frequency, 0),
+            'volume': np.where(in_window, state.volume, 0.0),
+        }, index=self.customers)
+
+    def get_segments(self, model_type, focus_type):
+        """Segmentos na data do estado: mesmo resultado de get_customer_segments (clientes na ordem do estado)."""
+        if not self._meta['focus_has_rows'].get(focus_type):
+            return pd.DataFrame()
+        rules_config = (RFV_RULES_NOVO if model_type == 'novo' else RFV_RULES_ANTIGO)[focus_type]
+        df_rfv = score_rfv_metrics(self.get_metrics(focus_type), rules_config)
+        # Sem primeira compra conhecida vira NaT (nunca é NOVO CLIENTE)
+        first_purchase_ns = np.where(self.first_purchase_ns == SEM_PRIMEIRA_COMPRA, SEM_COMPRA, self.first_purchase_ns)
+        first_purchase = pd.Series(first_purchase_ns.view('datetime64[ns]'), index=self.customers)
+        return _build_segments(df_rfv, self.customers, first_purchase, self.as_of, model_type)
+
+    # --- Verificação ---
+
+    def verify(self, df_all_transactions, focus_columns=FOCUS_COLUMNS):
+        """
+        Compara o estado com o recálculo completo a partir do histórico (calculate_rfv_metrics_by_focus
+        e get_customer_segments na data do estado).
+
+        Returns:
+            pd.DataFrame: por (modelo, foco), o número de clientes e de divergências nos valores
+                brutos e nas categorias. Divergências também são registradas no log.
+        """
+        with span('rfv_state.verify', data=self.as_of.date()):
+            full_metrics = calculate_rfv_metrics_by_focus(df_all_transactions, self.as_of, {focus: SKU_MAP[focus] for _, focus in focus_columns})
+            rows = []
+            for (model_type, focus_type), column in focus_columns.items():
+                expected_metrics = full_metrics[focus_type]
+                metrics = self.get_metrics(focus_type).reindex(expected_metrics.index)
+                metric_diffs = (
+                    (metrics['recency_days'] != expected_metrics['recency_days'])
+                    | (metrics['frequency'] != expected_metrics['frequency'])
+                    | ~np.isclose(metrics['volume'], expected_metrics['volume'])
+                )
+                expected_segments = get_customer_segments(df_all_transactions, self.as_of, model_type, focus_type)
+                segments = self.get_segments(model_type, focus_type)
+                if expected_segments.empty or segments.empty:
+                    category_diffs = pd.Series(expected_segments.empty != segments.empty, index=[column])
+                else:
+                    segments = segments.reindex(expected_segments.index)
+                    category_diffs = (segments['categoria'] != expected_segments['categoria']) | (segments['Total_score'] != expected_segments['Total_score'])
+                rows.append({
+                    'modelo': model_type, 'foco': focus_type, 'coluna': column, 'clientes': len(expected_metrics),
+                    'divergencias_metricas': int(metric_diffs.sum()), 'divergencias_categorias': int(category_diffs.sum()),
+                    'clientes_extras': int(len(self.customers.difference(expected_metrics.index))),
+                })
+            report = pd.DataFrame(rows)
+
+        if report[['divergencias_metricas', 'divergencias_categorias', 'clientes_extras']].to_numpy().any():
+            log_event(logger, "Estado de RFV diverge do recálculo completo", logging.WARNING, data=self.as_of.date(), relatorio=report.to_dict('records'))
+        return report
@@ -0,0 +1,150 @@
+# Em core/rfv_tables.py
+
+"""
+Compila as regras de core/rfv_rules.py em tabelas de consulta (arrays NumPy).
+
+- Cada regra de pontuação ({(low, high): score}) vira arrays ordenados de limites e scores,
+  permitindo pontuar um array inteiro de valores com um único np.searchsorted.
+- Cada dicionário de categorias (CATEGORIAS_ANTIGO / CATEGORIAS_NOVO) vira uma tabela
+  score -> código inteiro, sobre um vocabulário fixo de categorias por modelo. Assim as
+  etapas seguintes (matrizes, crosstabs) trabalham só com inteiros, nunca com strings.
+
+As faixas são validadas na compilação: regras sem faixas, faixas sobrepostas ou com buracos
+geram ValueError.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from .rfv_rules import RFV_RULES_ANTIGO, RFV_RULES_NOVO, CATEGORIAS_ANTIGO, CATEGORIAS_NOVO
+
+# Categorias que não vêm dos scores, mas aparecem nas análises
+CATEGORIA_CHURN = "CHURN"
+CATEGORIA_NOVO_CLIENTE = "NOVO CLIENTE"
+CATEGORIA_ENTRANTE = "ENTRANTE NA BASE"
+CATEGORIA_INDEFINIDA = "INDEFINIDO"
+
+# Abaixo deste score total o cliente é CHURN (mesma regra de get_category)
+SCORE_MINIMO_CATEGORIA = 3
+
+# --- Tabelas de Pontuação ---
+
+@dataclass(frozen=True)
+class ScoreTable:
+    """Faixas de uma regra de pontuação, ordenadas pelo limite inferior."""
+    lows: np.ndarray
+    highs: np.ndarray
+    scores: np.ndarray
+
+    def score(self, values):
+        """
+        Pontua um array de valores. Mesma semântica de get_score: valor 0 -> 0,
+        valor fora de todas as faixas (inclusive nos buracos entre inteiros, ex: 3.5) -> 0.
+        """
+        values = np.asarray(values, dtype=float)
+        idx = np.searchsorted(self.lows, values, side='right') - 1
+        valid = (idx >= 0) & (values != 0)
+        idx_safe = np.clip(idx, 0, None)
+        valid &= values <= self.highs[idx_safe]
+        return np.where(valid, self.scores[idx_safe], 0).astype('int64')
+
+def _sorted_ranges(ranges, rule_name):
+    """Ordena faixas (low, high) e valida que não há sobreposições nem buracos entre elas."""
+    ranges = sorted(ranges, key=lambda item: item[0][0])
+    for (low, high), _ in ranges:
+        if low > high:
+            raise ValueError(f"Regra '{rule_name}': faixa inválida ({low}, {high}).")
+    for ((_, prev_high), _), ((low, high), _) in zip(ranges, ranges[1:]):
+        if low <= prev_high:
+            raise ValueError(f"Regra '{rule_name}': faixa ({low}, {high}) se sobrepõe a outra que termina em {prev_high}.")
+        if low > prev_high + 1:
+            raise ValueError(f"Regra '{rule_name}': buraco entre {prev_high} e {low}.")
+    return ranges
+
+def compile_score_rules(rules_dict, rule_name="regra"):
+    """Compila um dicionário {(low, high): score} em uma ScoreTable validada."""
+    if not rules_dict:
+        raise ValueError(f"Regra '{rule_name}': nenhuma faixa definida.")
+    ranges = _sorted_ranges(rules_dict.items(), rule_name)
+    return ScoreTable(
+        lows=np.array([r[0] for r, _ in ranges], dtype=float),
+        highs=np.array([r[1] for r, _ in ranges], dtype=float),
+        scores=np.array([s for _, s in ranges], dtype='int64'),
+    )
+
+def compile_rules_config(rules_config, rule_name="regra"):
+    """Compila a configuração de um foco ({'R': ..., 'F': ..., 'V': ...})."""
+    return {dim: compile_score_rules(rules, f"{rule_name}/{dim}") for dim, rules in rules_config.items()}
+
+# --- Tabelas de Categoria ---
+
+@dataclass(frozen=True)
+class CategoryTable:
+    """Vocabulário fixo de categorias de um modelo e a tabela score total -> código."""
+    vocabulary: tuple
+    score_to_code: np.ndarray
+
+    def code_of(self, category_name):
+        return self.vocabulary.index(category_name)
+
+    def codes(self, scores):
+        """Converte um array de scores totais em códigos de categoria (int8)."""
+        scores = np.asarray(scores, dtype='int64')
+        in_table = (scores >= 0) & (scores < len(self.score_to_code))
+        codes = np.full(scores.shape, self.code_of(CATEGORIA_INDEFINIDA), dtype='int8')
+        codes[in_table] = self.score_to_code[scores[in_table]]
+        codes[scores < SCORE_MINIMO_CATEGORIA] = self.code_of(CATEGORIA_CHURN)
+        return codes
+
+    def names(self, codes):
+        """Converte códigos de volta para os nomes das categorias (array de objetos)."""
+        return np.asarray(self.vocabulary, dtype=object)[np.asarray(codes, dtype='int64')]
+
+def compile_categories(categorias, model_name="modelo"):
+    """
+    Compila CATEGORIAS_ANTIGO (chaves int) ou CATEGORIAS_NOVO (chaves (low, high)) em uma
+    CategoryTable. O vocabulário segue a ordem crescente de score:
+    CHURN, NOVO CLIENTE, categorias do modelo..., ENTRANTE NA BASE, INDEFINIDO.
+    """
+    ranges = [((key, key) if isinstance(key, int) else tuple(key), name) for key, name in categorias.items()]
+    ranges = _sorted_ranges(ranges, model_name)
+    if ranges and ranges[0][0][0] != SCORE_MINIMO_CATEGORIA:
+        raise ValueError(f"Categorias '{model_name}': a primeira faixa deve começar em {SCORE_MINIMO_CATEGORIA}.")
+
+    vocabulary = (CATEGORIA_CHURN, CATEGORIA_NOVO_CLIENTE, *[name for _, name in ranges], CATEGORIA_ENTRANTE, CATEGORIA_INDEFINIDA)
+    if len(set(vocabulary)) != len(vocabulary):
+        raise ValueError(f"Categorias '{model_name}': nomes de categoria repetidos.")
+
+    max_score = int(ranges[-1][0][1]) if ranges else SCORE_MINIMO_CATEGORIA - 1
+    score_to_code = np.full(max_score + 1, vocabulary.index(CATEGORIA_INDEFINIDA), dtype='int8')
+    for (low, high), name in ranges:
+        score_to_code[int(low):int(high) + 1] = vocabulary.index(name)
+    return CategoryTable(vocabulary=vocabulary, score_to_code=score_to_code)
+
+# --- Tabelas Compiladas (validadas na importação) ---
+
+COMPILED_RULES = {
+    'antigo': {focus: compile_rules_config(config, f"antigo/{focus}") for focus, config in RFV_RULES_ANTIGO.items()},
+    'novo': {focus: compile_rules_config(config, f"novo/{focus}") for focus, config in RFV_RULES_NOVO.items()},
+}
+
+def get_compiled_rules(rules_config, rule_name="regra"):
+    """
+    Tabelas de um foco: as já compiladas na importação quando rules_config é uma das regras de
+    core/rfv_rules.py (o caso normal), senão compiladas na hora (ex: regras do simulador).
+    """
+    for model_type, rules_set in (('antigo', RFV_RULES_ANTIGO), ('novo', RFV_RULES_NOVO)):
+        for focus, config in rules_set.items():
+            if config is rules_config or config == rules_config:
+                return COMPILED_RULES[model_type][focus]
+    return compile_rules_config(rules_config, rule_name)
+
+CATEGORY_TABLES = {
+    'antigo': compile_categories(CATEGORIAS_ANTIGO, 'antigo'),
+    'novo': compile_categories(CATEGORIAS_NOVO, 'novo'),
+}
+
+def get_category_table(model_type):
+    """Mesma convenção de get_category: qualquer modelo diferente de 'antigo' usa o novo."""
+    return CATEGORY_TABLES['antigo' if model_type == 'antigo' else 'novo']
@@ -0,0 +1,254 @@
+# Em core/rule_simulator.py
+
+"""
+Simulador de regras ("what-if"): mostra o efeito de mudar uma faixa de R, F ou V (ex: recência
+de Cilindros de 60 para 75 dias) sem recalcular nada a partir das transações.
+
+Scores e categorias dependem só dos valores brutos de cada cliente (recency_days, frequency,
+volume) e do tempo de casa (para NOVO CLIENTE). Esses valores são calculados uma vez por
+snapshot e guardados em Parquet com tipos compactos, no mesmo esquema de cache LRU dos
+snapshots (core/snapshot_cache.py). A simulação é só pontuar arrays com as regras novas e
+contar: bem abaixo de um segundo para a base toda.
+
+As métricas de um snapshot são gravadas pela linha de comando (no job que gera os snapshots):
+    python -m core.rule_simulator --state /caminho/do/estado_rfv
+    python -m core.rule_simulator --transactions transacoes.parquet --date 2025-06-30
+Com --state, saem do estado incremental (core/rfv_state.py) na data dele, sem reler o histórico.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .rfv_calculator import NS_PER_DAY, calculate_rfv_metrics_by_focus
+from .rfv_state import RFVStateStore, SEM_PRIMEIRA_COMPRA
+from .rfv_rules import RFV_RULES_ANTIGO, RFV_RULES_NOVO
+from .rfv_tables import get_compiled_rules, get_category_table, CATEGORIA_CHURN, CATEGORIA_ENTRANTE, CATEGORIA_NOVO_CLIENTE
+from .snapshot_cache import SnapshotCache
+from .tava_ta_analyzer import SKU_MAP
+from utils.logger import span
+
+RAW_METRICS_DIR = os.environ.get("RFV_RAW_METRICS_DIR", os.path.join(tempfile.gettempdir(), "rfv_raw_metrics"))
+RAW_METRICS_MAX_BYTES = int(os.environ.get("RFV_RAW_METRICS_MAX_BYTES", 1024**3))
+
+# Mesmo limite de get_customer_segments: até 90 dias de casa o cliente é NOVO CLIENTE
+NOVO_CLIENTE_MAX_DIAS = 90
+# Tempo de casa desconhecido (sem data de primeira compra): nunca é NOVO CLIENTE
+TEMPO_DE_CASA_DESCONHECIDO = np.iinfo('int32').max
+
+
+# --- Métricas Brutas por Snapshot ---
+
+def _compact_volume(volume):
+    """Volume em int32 quando é inteiro (o caso normal); senão mantém float64 para pontuar igual."""
+    if np.all(np.mod(volume, 1) == 0) and (len(volume) == 0 or volume.max() <= np.iinfo('int32').max):
+        return volume.astype('int32')
+    return volume
+
+def build_raw_metrics(df_all_transactions, analysis_date, focus_types=None):
+    """
+    Calcula os valores brutos de R, F e V de todos os focos (um único agrupamento, ver
+    calculate_rfv_metrics_by_focus) e o tempo de casa de cada cliente na data do snapshot.
+
+    Returns:
+        pd.DataFrame: uma linha por cliente, com 'cod_cliente', 'tempo_de_casa' e, por foco,
+            '<foco>_recency_days' (int16), '<foco>_frequency' (int32) e '<foco>_volume'.
+    """
+    focus_types = focus_types or list(SKU_MAP)
+    analysis_date = pd.to_datetime(analysis_date)
+    metrics = calculate_rfv_metrics_by_focus(df_all_transactions, analysis_date, {focus: SKU_MAP[focus] for focus in focus_types})
+    customer_ids = next(iter(metrics.values())).index
+
+    first_purchase = df_all_transactions.groupby('cod_cliente')['data_compra'].min().reindex(customer_ids)
+    tenure_days = (analysis_date - first_purchase).dt.days
+
+    df_raw = pd.DataFrame({
+        'cod_cliente': customer_ids,
+        'tempo_de_casa': tenure_days.fillna(TEMPO_DE_CASA_DESCONHECIDO).astype('int32').to_numpy(),
+    })
+    for focus, df_metrics in metrics.items():
+        df_raw[f'{focus}_recency_days'] = df_metrics['recency_days'].to_numpy().astype('int16')
+        df_raw[f'{focus}_frequency'] = df_metrics['frequency'].to_numpy().astype('int32')
+        df_raw[f'{focus}_volume'] = _compact_volume(df_metrics['volume'].to_numpy())
+    return df_raw
+
+def build_raw_metrics_from_state(state_store, focus_types=None):
+    """Mesmo resultado de build_raw_metrics, a partir do estado incremental na data dele (state_store.as_of)."""
+    focus_types = focus_types or list(SKU_MAP)
+    unknown = state_store.first_purchase_ns == SEM_PRIMEIRA_COMPRA
+    tenure_days = np.where(unknown, 0, state_store.as_of.value - state_store.first_purchase_ns) // NS_PER_DAY
+    df_raw = pd.DataFrame({
+        'cod_cliente': state_store.customers,
+        'tempo_de_casa': np.where(unknown, TEMPO_DE_CASA_DESCONHECIDO, tenure_days).astype('int32'),
+    })
+    for focus in focus_types:
+        df_metrics = state_store.get_metrics(focus)
+        df_raw[f'{focus}_recency_days'] = df_metrics['recency_days'].to_numpy().astype('int16')
+        df_raw[f'{focus}_frequency'] = df_metrics['frequency'].to_numpy().astype('int32')
+        df_raw[f'{focus}_volume'] = _compact_volume(df_metrics['volume'].to_numpy())
+    return df_raw
+
+_raw_metrics_cache = None
+
+def get_raw_metrics_cache():
+    global _raw_metrics_cache
+    if _raw_metrics_cache is None:
+        _raw_metrics_cache = SnapshotCache(RAW_METRICS_DIR, RAW_METRICS_MAX_BYTES)
+    return _raw_metrics_cache
+
+def store_raw_metrics(df_all_transactions, analysis_date, cache=None):
+    """Calcula e guarda as métricas brutas de um snapshot (para o job semanal)."""
+    df_raw = build_raw_metrics(df_all_transactions, analysis_date)
+    (cache or get_raw_metrics_cache()).put(analysis_date, df_raw)
+    return df_raw
+
+def store_raw_metrics_from_state(state_store, cache=None):
+    """Grava as métricas brutas do snapshot da data do estado incremental (ver core/rfv_state.py)."""
+    df_raw = build_raw_metrics_from_state(state_store)
+    (cache or get_raw_metrics_cache()).put(state_store.as_of, df_raw)
+    return df_raw
+
+def load_raw_metrics(analysis_date, focus_type, cache=None):
+    """Métricas brutas de um foco num snapshot (só as colunas dele), ou None se não estiverem em cache."""
+    columns = ['cod_cliente', 'tempo_de_casa'] + [f'{focus_type}_{metric}' for metric in ('recency_days', 'frequency', 'volume')]
+    return (cache or get_raw_metrics_cache()).get(analysis_date, columns=columns)
+
+
+# --- Simulação ---
+
+def get_current_rules(model_type, focus_type):
+    return (RFV_RULES_NOVO if model_type == 'novo' else RFV_RULES_ANTIGO)[focus_type]
+
+class RuleSimulator:
+    """
+    Simulação Tava -> Tá de um foco. O alinhamento dos clientes dos dois snapshots (outer join)
+    é feito uma vez na criação; cada simulate() só pontua e conta.
+    """
+
+    def __init__(self, raw_tava, raw_ta, focus_type):
+        self.focus_type = focus_type
+        self._n_customers = len(raw_ta)
+        ids_tava = pd.Index(raw_tava['cod_cliente'])
+        ids_ta = pd.Index(raw_ta['cod_cliente'])
+        # Posição de cada cliente do Tá no Tava (-1: entrante) e clientes do Tava que saíram
+        self._ta_in_tava = ids_tava.get_indexer(ids_ta)
+        self._tava_only = np.ones(len(ids_tava), dtype=bool)
+        self._tava_only[self._ta_in_tava[self._ta_in_tava >= 0]] = False
+        # Recência, frequência e volume têm poucos valores distintos: as regras são aplicadas só
+        # a eles e o resultado é expandido para os clientes por índice
+        self._values = {
+            'tava': self._factorize(raw_tava, focus_type),
+            'ta': self._factorize(raw_ta, focus_type),
+        }
+
+    @staticmethod
+    def _factorize(raw, focus_type):
+        values = {}
+        for dim, metric in (('R', 'recency_days'), ('F', 'frequency'), ('V', 'volume')):
+            uniques, inverse = np.unique(raw[f'{focus_type}_{metric}'].to_numpy(), return_inverse=True)
+            values[dim] = (uniques, inverse.astype('int32'))
+        values['novo_cliente'] = raw['tempo_de_casa'].to_numpy() <= NOVO_CLIENTE_MAX_DIAS
+        return values
+
+    def _codes(self, values, model_type, tables):
+        scores = 0
+        for dim in ('R', 'F', 'V'):
+            uniques, inverse = values[dim]
+            scores = scores + tables[dim].score(uniques)[inverse]
+        category_table = get_category_table(model_type)
+        codes = category_table.codes(scores)
+        codes[values['novo_cliente']] = category_table.code_of(CATEGORIA_NOVO_CLIENTE)
+        return codes
+
+    def simulate(self, model_type, rules_config=None):
+        """
+        Aplica as regras (padrão: as atuais de core/rfv_rules.py) aos dois snapshots.
+
+        Returns:
+            dict: 'distribuicao' (DataFrame com a contagem de clientes por categoria no Tava e no
+                Tá) e 'matriz' (Tava -> Tá, mesmo formato de data_loader.get_migration_matrix).
+
+        Raises:
+            ValueError: Se alguma dimensão não tiver faixas, ou se as faixas se sobrepuserem ou tiverem buracos.
+        """
+        if rules_config is None:
+            rules_config = get_current_rules(model_type, self.focus_type)
+        tables = get_compiled_rules(rules_config, f"simulação/{self.focus_type}")
+        category_table = get_category_table(model_type)
+        vocabulary = list(category_table.vocabulary)
+        n_codes = len(vocabulary)
+
+        with span('simulador.simulate', foco=self.focus_type, modelo=model_type, clientes=self._n_customers):
+            codes_tava = self._codes(self._values['tava'], model_type, tables).astype('int64')
+            codes_ta = self._codes(self._values['ta'], model_type, tables).astype('int64')
+
+            # Outer join: quem não estava no Tava é ENTRANTE NA BASE; quem saiu no Tá é CHURN
+            in_tava = self._ta_in_tava >= 0
+            origem = np.where(in_tava, codes_tava[np.clip(self._ta_in_tava, 0, None)], category_table.code_of(CATEGORIA_ENTRANTE))
+            origem = np.concatenate([origem, codes_tava[self._tava_only]])
+            destino = np.concatenate([codes_ta, np.full(int(self._tava_only.sum()), category_table.code_of(CATEGORIA_CHURN))])
+            counts = np.bincount(origem * n_codes + destino, minlength=n_codes * n_codes).reshape(n_codes, n_codes)
+
+            rows, cols = counts.sum(axis=1) > 0, counts.sum(axis=0) > 0
+            matriz = pd.DataFrame(
+                counts[np.ix_(rows, cols)],
+                index=pd.Index(np.array(vocabulary)[rows], name='categoria_tava'),
+                columns=pd.Index(np.array(vocabulary)[cols], name='categoria_ta'),
+            )
+            distribuicao = pd.DataFrame({
+                'Tava': np.bincount(codes_tava, minlength=n_codes),
+                'Tá': np.bincount(codes_ta, minlength=n_codes),
+            }, index=pd.Index(vocabulary, name='categoria'))
+            distribuicao = distribuicao[distribuicao.sum(axis=1) > 0]
+        return {'distribuicao': distribuicao, 'matriz': matriz}
+
+def rules_to_frame(rules_config):
+    """Regras de um foco como tabela editável (dimensão, mínimo, máximo, score); máximo infinito vira vazio."""
+    rows = [
+        {'dimensao': dim, 'minimo': low, 'maximo': np.nan if high == float('inf') else high, 'score': score}
+        for dim, ranges in rules_config.items() for (low, high), score in ranges.items()
+    ]
+    return pd.DataFrame(rows, columns=['dimensao', 'minimo', 'maximo', 'score'])
+
+def rules_from_frame(df_rules):
+    """Inverso de rules_to_frame. Linhas incompletas são ignoradas; máximo vazio é infinito."""
+    rules_config = {'R': {}, 'F': {}, 'V': {}}
+    for row in df_rules.dropna(subset=['dimensao', 'minimo', 'score']).itertuples(index=False):
+        if row.dimensao not in rules_config:
+            raise ValueError(f"Dimensão inválida: {row.dimensao!r} (use R, F ou V).")
+        high = float('inf') if pd.isna(row.maximo) else row.maximo
+        rules_config[row.dimensao][(row.minimo, high)] = int(row.score)
+    return rules_config
+
+
+# --- Linha de Comando ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grava as métricas brutas de um snapshot para o simulador de regras.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--state', help="Diretório do estado incremental de RFV (core/rfv_state.py); usa a data dele.")
+    source.add_argument('--transactions', help="Parquet com as transações (cod_cliente, data_compra, nf_sap, volume, tipo_sku).")
+    parser.add_argument('--date', help="Data do snapshot (obrigatória com --transactions).")
+    args = parser.parse_args(argv)
+
+    if args.state:
+        state_store = RFVStateStore(args.state)
+        if state_store.as_of is None:
+            parser.error(f"O estado em {args.state} ainda está vazio.")
+        analysis_date = state_store.as_of
+        df_raw = store_raw_metrics_from_state(state_store)
+    else:
+        if not args.date:
+            parser.error("--date é obrigatória com --transactions.")
+        analysis_date = pd.Timestamp(args.date)
+        df_raw = store_raw_metrics(pd.read_parquet(args.transactions), analysis_date)
+    print(f"Métricas brutas de {analysis_date.date()} gravadas em {RAW_METRICS_DIR} ({len(df_raw)} clientes).")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,251 @@
+# Em core/segment_store.py
+
+"""
+Armazenamento colunar compacto do histórico de segmentos (RFV_ANALISE_HISTORICO).
+
+Estrutura em disco (um diretório):
+    meta.json          -> snapshots (datas ISO), colunas de categoria e vocabulário de cada coluna
+    customers.parquet  -> índice denso de clientes (posição -> cod_cliente)
+    codes_<coluna>.int8 -> matriz int8 (clientes x snapshots) com o código da categoria,
+                           memory-mapped e gravada por coluna (ordem Fortran): cada snapshot
+                           é um bloco contíguo de bytes.
+
+Código -1 significa "cliente fora do snapshot" e -2 "cliente no snapshot com categoria nula";
+os demais códigos indexam
+o vocabulário da coluna, que começa pelo vocabulário fixo do modelo (core/rfv_tables.py).
+
+Com isso, a matriz Tava -> Tá de qualquer par de datas é um np.bincount sobre duas colunas de
+códigos, sem merge, e caminhos de migração por vários snapshots custam o mesmo.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from .migration_index import MigrationCellIndex
+from .rfv_tables import get_category_table, CATEGORIA_CHURN, CATEGORIA_ENTRANTE
+
+META_FILE_NAME = "meta.json"
+CUSTOMERS_FILE_NAME = "customers.parquet"
+AUSENTE = -1
+SEM_CATEGORIA = -2
+MAX_BINCOUNT_KEYS = 2**24
+
+
+def _model_of_column(category_column_name):
+    return 'antigo' if category_column_name.endswith('_antigo') else 'novo'
+
+def _snapshot_key(snapshot_date):
+    return pd.Timestamp(snapshot_date).strftime('%Y-%m-%d')
+
+def _encode(values, vocabulary):
+    """Estende o vocabulário com valores ainda não vistos e codifica em int8 (nulo -> SEM_CATEGORIA)."""
+    vocabulary = list(vocabulary)
+    vocabulary += sorted(set(values.dropna().unique()) - set(vocabulary))
+    if len(vocabulary) > np.iinfo('int8').max:
+        raise ValueError("Vocabulário de categorias grande demais para códigos int8.")
+    codes = pd.Categorical(values, categories=vocabulary).codes.astype('int8')
+    codes[codes == -1] = SEM_CATEGORIA
+    return codes, tuple(vocabulary)
+
+
+class SegmentHistoryStore:
+    def __init__(self, path):
+        self.path = path
+        self._load()
+
+    def _load(self):
+        with open(os.path.join(self.path, META_FILE_NAME)) as f:
+            meta = json.load(f)
+        self.snapshots = [pd.Timestamp(d) for d in meta['snapshots']]
+        self.columns = meta['columns']
+        self.vocabularies = {column: tuple(vocab) for column, vocab in meta['vocabularies'].items()}
+        self.customers = pd.Index(pd.read_parquet(os.path.join(self.path, CUSTOMERS_FILE_NAME))['cod_cliente'], name='cod_cliente')
+        self._matrices = {}
+
+    # --- Construção ---
+
+    @classmethod
+    def build(cls, path, df_history, columns):
+        """
+        Cria o store a partir do histórico em formato longo (data_snapshot, cod_cliente, colunas de
+        categoria), como a tabela RFV_ANALISE_HISTORICO ou o resultado de get_customer_segments_multi_date.
+        """
+        os.makedirs(path, exist_ok=True)
+        snapshot_codes, snapshots = pd.factorize(pd.to_datetime(df_history['data_snapshot']), sort=True)
+        customer_codes, customers = pd.factorize(df_history['cod_cliente'])
+
+        vocabularies = {}
+        for column in columns:
+            codes, vocabulary = _encode(df_history[column], get_category_table(_model_of_column(column)).vocabulary)
+
+            matrix = cls._create_matrix(path, column, len(customers), len(snapshots))
+            matrix[customer_codes, snapshot_codes] = codes
+            matrix.flush()
+            vocabularies[column] = vocabulary
+
+        pd.DataFrame({'cod_cliente': customers}).to_parquet(os.path.join(path, CUSTOMERS_FILE_NAME), index=False)
+        cls._write_meta(path, [_snapshot_key(d) for d in snapshots], list(columns), {c: list(v) for c, v in vocabularies.items()})
+        return cls(path)
+
+    @staticmethod
+    def _matrix_path(path, column):
+        return os.path.join(path, f"codes_{column}.int8")
+
+    @classmethod
+    def _create_matrix(cls, path, column, n_customers, n_snapshots):
+        matrix = np.memmap(cls._matrix_path(path, column), dtype='int8', mode='w+', shape=(n_customers, max(n_snapshots, 1)), order='F')
+        matrix[:] = AUSENTE
+        return matrix
+
+    @staticmethod
+    def _write_meta(path, snapshots, columns, vocabularies):
+        tmp_path = os.path.join(path, META_FILE_NAME + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({'snapshots': snapshots, 'columns': columns, 'vocabularies': vocabularies}, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(path, META_FILE_NAME))
+
+    def append_snapshot(self, snapshot_date, df_snapshot):
+        """
+        Acrescenta um snapshot (cod_cliente + colunas de categoria, ex: get_data_for_snapshot).
+        Sem clientes novos, só os bytes do novo snapshot são escritos no fim de cada arquivo;
+        com clientes novos, as matrizes são regravadas com mais linhas.
+        """
+        if pd.Timestamp(snapshot_date) in self.snapshots:
+            raise ValueError(f"Snapshot {_snapshot_key(snapshot_date)} já está no store.")
+        if self.snapshots and pd.Timestamp(snapshot_date) < self.snapshots[-1]:
+            raise ValueError("Snapshots devem ser acrescentados em ordem cronológica.")
+
+        new_customers = pd.Index(df_snapshot['cod_cliente'].unique()).difference(self.customers, sort=False)
+        customers = self.customers.append(pd.Index(new_customers, name='cod_cliente'))
+        rows = customers.get_indexer(df_snapshot['cod_cliente'])
+        n_old, n_snapshots = len(self.customers), len(self.snapshots)
+
+        vocabularies = dict(self.vocabularies)
+        for column in self.columns:
+            codes, vocabularies[column] = _encode(df_snapshot[column], vocabularies[column])
+            self._matrices.pop(column, None)
+
+            if len(new_customers) == 0 and n_snapshots:
+                # Ordem Fortran: o novo snapshot é só um bloco de bytes no fim do arquivo
+                snapshot_codes = np.full(n_old, AUSENTE, dtype='int8')
+                snapshot_codes[rows] = codes
+                with open(self._matrix_path(self.path, column), "ab") as f:
+                    f.write(snapshot_codes.tobytes())
+                continue
+
+            old_matrix = self._matrix(column)
+            matrix_path = self._matrix_path(self.path, column)
+            tmp_path = matrix_path + ".tmp"
+            matrix = np.memmap(tmp_path, dtype='int8', mode='w+', shape=(len(customers), n_snapshots + 1), order='F')
+            matrix[:] = AUSENTE
+            if n_snapshots:
+                matrix[:n_old, :n_snapshots] = old_matrix[:, :n_snapshots]
+            matrix[rows, n_snapshots] = codes
+            matrix.flush()
+            del matrix, old_matrix
+            os.replace(tmp_path, matrix_path)
+
+        pd.DataFrame({'cod_cliente': customers}).to_parquet(os.path.join(self.path, CUSTOMERS_FILE_NAME), index=False)
+        snapshots = self.snapshots + [pd.Timestamp(snapshot_date)]
+        self._write_meta(self.path, [_snapshot_key(d) for d in snapshots], self.columns, {c: list(v) for c, v in vocabularies.items()})
+        self._load()
+
+    # --- Leitura ---
+
+    def _matrix(self, column):
+        if column not in self.columns:
+            raise ValueError(f"Coluna {column!r} não está no store.")
+        if column not in self._matrices:
+            shape = (len(self.customers), max(len(self.snapshots), 1))
+            self._matrices[column] = np.memmap(self._matrix_path(self.path, column), dtype='int8', mode='r', shape=shape, order='F')
+        return self._matrices[column]
+
+    def _snapshot_position(self, snapshot_date):
+        try:
+            return self.snapshots.index(pd.Timestamp(snapshot_date))
+        except ValueError:
+            raise ValueError(f"Snapshot {_snapshot_key(snapshot_date)} não está no store.") from None
+
+    def get_codes(self, column, snapshot_date):
+        """Códigos int8 de todos os clientes do store no snapshot (AUSENTE / SEM_CATEGORIA para os negativos)."""
+        return self._matrix(column)[:, self._snapshot_position(snapshot_date)]
+
+    def get_categories(self, column, snapshot_date):
+        """Categorias do snapshot como Series indexada por cod_cliente (só clientes presentes)."""
+        codes = np.asarray(self.get_codes(column, snapshot_date))
+        present = codes != AUSENTE
+        names = np.asarray(self.vocabularies[column] + (None,), dtype=object)[codes[present]]
+        return pd.Series(names, index=self.customers[present], name=column)
+
+    def get_migration_matrix(self, column, data_tava, data_ta):
+        """
+        Matriz Tava -> Tá por bincount das duas colunas de códigos. Mesmo resultado de
+        core.data_loader.get_migration_matrix (ENTRANTE NA BASE / CHURN para quem não estava).
+        """
+        paths = self.get_migration_paths(column, [data_tava, data_ta])
+        matriz = paths.pivot_table(index=paths.columns[0], columns=paths.columns[1], values='clientes', aggfunc='sum', fill_value=0)
+        return matriz.rename_axis(index='categoria_tava', columns='categoria_ta').astype('int64')
+
+    def get_migration_index(self, column, data_tava, data_ta):
+        """Índice de drill-down (célula -> clientes) do par de snapshots; ver core/migration_index.py."""
+        seen, (codes_tava, codes_ta) = self._path_codes(column, [data_tava, data_ta])
+        return MigrationCellIndex(self.customers.to_numpy()[seen], codes_tava[seen], codes_ta[seen], self.vocabularies[column])
+
+    def _path_codes(self, column, snapshot_dates):
+        """
+        Códigos de cada cliente em cada snapshot da sequência, já com ENTRANTE NA BASE / CHURN para
+        ausências e categorias nulas. Retorna (máscara dos clientes presentes em algum snapshot, códigos por passo).
+        """
+        vocabulary = self.vocabularies[column]
+        code_entrante, code_churn = vocabulary.index(CATEGORIA_ENTRANTE), vocabulary.index(CATEGORIA_CHURN)
+
+        matrix = self._matrix(column)
+        seen = np.zeros(len(self.customers), dtype=bool)
+        steps = []
+        for step, snapshot_date in enumerate(snapshot_dates):
+            codes = np.asarray(matrix[:, self._snapshot_position(snapshot_date)], dtype='int64')
+            present = codes != AUSENTE
+            missing_code = np.where(seen | (present & (step > 0)), code_churn, code_entrante)
+            steps.append(np.where(codes >= 0, codes, missing_code))
+            seen |= present
+        return seen, steps
+
+    def get_migration_paths(self, column, snapshot_dates):
+        """
+        Conta os caminhos de categoria dos clientes por uma sequência de snapshots (ex: fluxos de
+        uma coorte ao longo de um trimestre). Antes de aparecer pela primeira vez o cliente é
+        'ENTRANTE NA BASE'; depois de ter aparecido, ausência é 'CHURN'. Categoria nula conta como
+        'ENTRANTE NA BASE' no primeiro snapshot e 'CHURN' nos demais, como em get_migration_matrix.
+
+        Returns:
+            pd.DataFrame: uma coluna por data (nome da categoria) e 'clientes' (contagem),
+                ordenado pela contagem decrescente.
+        """
+        vocabulary = self.vocabularies[column]
+        n_codes = len(vocabulary)
+        seen, steps = self._path_codes(column, snapshot_dates)
+
+        # Só entram clientes presentes em pelo menos um dos snapshots. Cada caminho vira uma chave
+        # inteira (base n_codes); para poucos passos a contagem é um bincount direto.
+        keys = np.zeros(int(seen.sum()), dtype='int64')
+        for codes in steps:
+            keys = keys * n_codes + codes[seen]
+        n_keys = n_codes ** len(steps)
+        if n_keys <= MAX_BINCOUNT_KEYS:
+            counts = np.bincount(keys, minlength=n_keys)
+            unique_keys = np.flatnonzero(counts)
+            counts = counts[unique_keys]
+        else:
+            unique_keys, counts = np.unique(keys, return_counts=True)
+
+        labels = []
+        for _ in steps:
+            labels.append(np.asarray(vocabulary, dtype=object)[unique_keys % n_codes])
+            unique_keys = unique_keys // n_codes
+        df_paths = pd.DataFrame(dict(enumerate(reversed(labels))))
+        df_paths.columns = [_snapshot_key(d) for d in snapshot_dates]
+        df_paths['clientes'] = counts
+        return df_paths.sort_values('clientes', ascending=False, kind='stable').reset_index(drop=True)
@@ -0,0 +1,109 @@
+# Em core/segment_streaming.py
+
+"""
+Segmentação em streaming (fora da memória): as transações chegam em blocos ordenados por
+cod_cliente (row groups de um Parquet, páginas de um resultado do BigQuery...) e os segmentos
+saem bloco a bloco, por um gerador. Nunca existe um DataFrame com o histórico inteiro: o pico de
+memória é limitado pelo tamanho do bloco (mais as transações do maior cliente).
+
+Uso típico (job semanal):
+    chunks = iter_parquet_transactions("transacoes_ordenadas.parquet")
+    write_segments_parquet(iter_customer_segments(chunks, data_snapshot), "snapshot.parquet")
+"""
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .tava_ta_analyzer import FOCUS_COLUMNS, _segment_all_focuses
+from utils.logger import span
+
+TRANSACTION_COLUMNS = ['cod_cliente', 'tipo_sku', 'data_compra', 'nf_sap', 'volume']
+DEFAULT_CHUNK_ROWS = 500_000
+
+
+# --- Leitura em Blocos ---
+
+def iter_parquet_transactions(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Lê um Parquet de transações (ordenado por cod_cliente) em blocos de até chunk_rows linhas."""
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=TRANSACTION_COLUMNS):
+        yield batch.to_pandas()
+
+def iter_bigquery_transactions(query, client=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Executa a query (que deve terminar com ORDER BY cod_cliente) e devolve o resultado página a
+    página, sem materializar o resultado inteiro.
+    """
+    from .data_loader import _get_client
+
+    rows = _get_client(client).query(query).result(page_size=chunk_rows)
+    yield from rows.to_dataframe_iterable()
+
+
+# --- Segmentação ---
+
+def iter_customer_segments(transaction_chunks, analysis_date, focus_columns=FOCUS_COLUMNS):
+    """
+    Segmenta clientes bloco a bloco, em todos os modelos e focos de focus_columns.
+
+    Os blocos devem vir ordenados por cod_cliente. As linhas do último cliente de cada bloco ficam
+    guardadas até o bloco seguinte, porque ele pode continuar ali; assim cada cliente é calculado
+    com todas as suas transações.
+
+    Args:
+        transaction_chunks (iterable): DataFrames de transações (colunas de TRANSACTION_COLUMNS).
+        analysis_date (datetime): A data de referência (data do snapshot).
+        focus_columns (dict): (modelo, foco) -> nome da coluna, como FOCUS_COLUMNS.
+
+    Yields:
+        pd.DataFrame: Indexado por 'cod_cliente', com uma coluna de categoria por item de
+            focus_columns. Concatenados, são iguais a get_all_customer_segments (quando todos os
+            focos têm transações na base).
+
+    Raises:
+        ValueError: Se as transações não estiverem ordenadas por cod_cliente.
+    """
+    pending = None
+    for i, chunk in enumerate(transaction_chunks):
+        if chunk.empty:
+            continue
+        if pending is not None:
+            chunk = pd.concat([pending, chunk], ignore_index=True)
+        if not chunk['cod_cliente'].is_monotonic_increasing:
+            raise ValueError(f"As transações do bloco {i} não estão ordenadas por cod_cliente.")
+
+        last_customer = chunk['cod_cliente'].iloc[-1]
+        is_complete = (chunk['cod_cliente'] != last_customer).to_numpy()
+        pending = chunk[~is_complete]
+        if is_complete.any():
+            with span('streaming.bloco', bloco=i, rows=int(is_complete.sum())):
+                yield _segment_all_focuses(chunk[is_complete], analysis_date, focus_columns)
+
+    if pending is not None:
+        with span('streaming.bloco', bloco='final', rows=len(pending)):
+            yield _segment_all_focuses(pending, analysis_date, focus_columns)
+
+
+# --- Escrita ---
+
+def write_segments_parquet(segment_chunks, path):
+    """
+    Grava os blocos de segmentos num único Parquet, um row group por bloco, à medida que chegam.
+
+    Returns:
+        int: Número de clientes gravados.
+    """
+    writer = None
+    n_rows = 0
+    try:
+        for df_segments in segment_chunks:
+            table = pa.Table.from_pandas(df_segments.reset_index(), preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            n_rows += len(df_segments)
+    finally:
+        if writer is not None:
+            writer.close()
+    return n_rows
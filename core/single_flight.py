@@ -0,0 +1,100 @@
+# Em core/single_flight.py
+
+"""
+Coalescência de requisições idênticas ("single-flight") entre sessões do Streamlit.
+
+Todas as sessões de um container rodam no mesmo processo. Quando várias pedem a mesma query ao
+mesmo tempo (ex: get_available_snapshots na segunda de manhã), só a primeira executa; as outras
+esperam e recebem o mesmo resultado. Opcionalmente o resultado fica guardado por `ttl` segundos.
+
+Contadores por operação:
+    hits      -> resultado servido de um cache (memória com TTL ou cache externo, ex: Parquet)
+    misses    -> query realmente executada
+    coalesced -> requisição que esperou uma query idêntica já em andamento
+"""
+
+import threading
+import time
+from collections import defaultdict
+
+
+def _share(result):
+    """Cada chamador recebe sua própria cópia (o app altera os DataFrames que recebe)."""
+    return result.copy() if hasattr(result, 'copy') else result
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._results = {}
+        self._stats = defaultdict(lambda: {'hits': 0, 'misses': 0, 'coalesced': 0})
+
+    def do(self, name, key, fn, ttl=0):
+        """Executa fn() uma única vez para chamadas simultâneas com o mesmo (name, key)."""
+        full_key = (name, key)
+        with self._lock:
+            memo = self._results.get(full_key)
+            if memo is not None and memo[0] > time.monotonic():
+                self._stats[name]['hits'] += 1
+                return _share(memo[1])
+
+            call = self._in_flight.get(full_key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._in_flight[full_key] = call
+                self._stats[name]['misses'] += 1
+            else:
+                self._stats[name]['coalesced'] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None and not isinstance(call.error, Exception):
+                # O líder foi interrompido (ex: job cancelado), não falhou: esta chamada tenta de novo
+                return self.do(name, key, fn, ttl)
+            if call.error is not None:
+                raise call.error
+            return _share(call.result)
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[full_key]
+                if call.error is None and ttl > 0:
+                    now = time.monotonic()
+                    self._results = {k: v for k, v in self._results.items() if v[0] > now}
+                    self._results[full_key] = (now + ttl, call.result)
+            call.event.set()
+        return _share(call.result)
+
+    def record_hit(self, name):
+        """Conta um hit de um cache externo (ex: o cache Parquet de snapshots)."""
+        with self._lock:
+            self._stats[name]['hits'] += 1
+
+    def forget(self, name=None):
+        """Descarta os resultados guardados (de uma operação ou de todas)."""
+        with self._lock:
+            self._results = {k: v for k, v in self._results.items() if name is not None and k[0] != name}
+
+    def stats(self):
+        """Cópia dos contadores por operação, com os totais em 'total'."""
+        with self._lock:
+            stats = {name: dict(counters) for name, counters in self._stats.items()}
+        stats['total'] = {
+            counter: sum(counters[counter] for counters in stats.values())
+            for counter in ('hits', 'misses', 'coalesced')
+        }
+        return stats
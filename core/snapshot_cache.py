@@ -0,0 +1,139 @@
+# Em core/snapshot_cache.py
+
+"""
+Cache local em Parquet dos snapshots da tabela RFV_ANALISE_HISTORICO.
+
+Cada snapshot (data_snapshot) é gravado uma única vez em um arquivo Parquet. As leituras
+seguintes carregam só as colunas pedidas (projeção), sem ir ao BigQuery. O tamanho total do
+cache é limitado: quando passa do limite, os snapshots usados há mais tempo são removidos (LRU,
+pela data de modificação do arquivo, que é atualizada a cada leitura).
+"""
+
+import json
+import os
+import tempfile
+import threading
+
+import pandas as pd
+
+DEFAULT_CACHE_DIR = os.environ.get("RFV_CACHE_DIR", os.path.join(tempfile.gettempdir(), "rfv_snapshot_cache"))
+DEFAULT_CACHE_MAX_BYTES = int(os.environ.get("RFV_CACHE_MAX_BYTES", 2 * 1024**3))
+
+INDEX_FILE_NAME = "snapshots_index.json"
+
+
+class SnapshotCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    # --- Caminhos ---
+
+    def _path(self, snapshot_date):
+        return os.path.join(self.cache_dir, f"snapshot_{pd.Timestamp(snapshot_date).strftime('%Y-%m-%d')}.parquet")
+
+    def _cached_files(self):
+        return [
+            os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+            if name.startswith("snapshot_") and name.endswith(".parquet")
+        ]
+
+    # --- Leitura e Escrita ---
+
+    def get(self, snapshot_date, columns=None):
+        """Lê o snapshot do cache (só as colunas pedidas). Retorna None se não estiver em cache."""
+        path = self._path(snapshot_date)
+        try:
+            df = pd.read_parquet(path, columns=columns)
+        except (FileNotFoundError, OSError):
+            return None
+        # Marca como usado agora (base da política LRU)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return df
+
+    def put(self, snapshot_date, df):
+        """Grava o snapshot de forma atômica e aplica o limite de tamanho do cache."""
+        path = self._path(snapshot_date)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        os.close(fd)
+        try:
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict()
+
+    def invalidate(self, snapshot_date):
+        try:
+            os.remove(self._path(snapshot_date))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for path in self._cached_files():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def size_bytes(self):
+        return sum(os.path.getsize(path) for path in self._cached_files() if os.path.exists(path))
+
+    def evict(self):
+        """Remove os snapshots menos usados recentemente até o cache caber em max_bytes."""
+        with self._lock:
+            entries = []
+            for path in self._cached_files():
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    # --- Invalidação por Novos Snapshots ---
+
+    def sync_snapshot_index(self, snapshot_dates):
+        """
+        Compara a lista de snapshots disponíveis com a última lista vista. Quando aparece um snapshot
+        novo, descarta do cache os snapshots que não existem mais e o snapshot que era o mais recente
+        (o único que o pipeline ainda pode ter reprocessado antes de publicar o novo).
+
+        Returns:
+            bool: True se a lista de snapshots mudou desde a última chamada.
+        """
+        current = sorted(pd.Timestamp(d).strftime('%Y-%m-%d') for d in snapshot_dates)
+        index_path = os.path.join(self.cache_dir, INDEX_FILE_NAME)
+        with self._lock:
+            try:
+                with open(index_path) as f:
+                    previous = json.load(f)
+            except (FileNotFoundError, ValueError):
+                previous = None
+
+            if previous == current:
+                return False
+            if previous:
+                stale = set(previous) - set(current)
+                if current and previous[-1] != current[-1]:
+                    stale.add(previous[-1])
+                for snapshot_date in stale:
+                    self.invalidate(snapshot_date)
+
+            with open(index_path, "w") as f:
+                json.dump(current, f)
+            return True
@@ -0,0 +1,114 @@
+# Em core/snapshot_index.py
+
+"""
+Índice persistido dos snapshots disponíveis (datas de data_snapshot), para a barra lateral do app
+abrir sem esperar o `SELECT DISTINCT data_snapshot` no BigQuery.
+
+O índice é um JSON pequeno gravado junto do app (ou em RFV_SNAPSHOT_INDEX_PATH). Cada execução do
+app lê o arquivo; se ele estiver mais velho que o intervalo de atualização, uma thread em segundo
+plano consulta o BigQuery (data_loader.get_available_snapshots, que também invalida os caches
+quando aparece um snapshot novo) e regrava o arquivo. A consulta só bloqueia a tela quando ainda
+não existe índice nenhum.
+
+Implantação: o índice não vai para o git. Para uma instância nova (Cloud Run) não pagar o
+SELECT DISTINCT na primeira tela, ele é gravado no build da imagem (`python -m core.snapshot_index`,
+ver Dockerfile); a partir daí a atualização em segundo plano o mantém. Com RFV_SNAPSHOT_INDEX_PATH
+apontando para um armazenamento compartilhado (ex: volume do Cloud Storage montado no serviço),
+todas as instâncias leem e atualizam o mesmo arquivo.
+
+Este módulo só usa a biblioteca padrão: o BigQuery e o pandas são importados apenas na atualização.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from utils.logger import get_logger, log_event
+
+SNAPSHOT_INDEX_PATH = os.environ.get(
+    "RFV_SNAPSHOT_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "snapshot_index.json"),
+)
+REFRESH_INTERVAL_SECONDS = int(os.environ.get("RFV_SNAPSHOT_INDEX_REFRESH_SECONDS", 300))
+
+logger = get_logger("rfv.snapshot_index")
+_refresh_lock = threading.Lock()
+_refresh_threads = {}
+
+
+def read_snapshot_index(path=SNAPSHOT_INDEX_PATH):
+    """Retorna (datas em ordem decrescente, horário da última atualização) ou (None, None) se não houver índice."""
+    try:
+        with open(path) as f:
+            index = json.load(f)
+        return [datetime.fromisoformat(d) for d in index['snapshots']], index['refreshed_at']
+    except (FileNotFoundError, ValueError, KeyError):
+        return None, None
+
+def write_snapshot_index(snapshot_dates, path=SNAPSHOT_INDEX_PATH):
+    """Grava o índice de forma atômica (quem lê ao mesmo tempo vê o arquivo antigo ou o novo)."""
+    snapshots = sorted((datetime(d.year, d.month, d.day) for d in snapshot_dates), reverse=True)
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump({'snapshots': [d.date().isoformat() for d in snapshots], 'refreshed_at': time.time()}, f)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return snapshots
+
+def refresh_snapshot_index(path=SNAPSHOT_INDEX_PATH, client=None):
+    """Consulta os snapshots no BigQuery e regrava o índice. Em caso de erro mantém o índice atual."""
+    from .data_loader import get_available_snapshots
+
+    snapshots = get_available_snapshots(client=client)
+    if not snapshots:
+        return None
+    return write_snapshot_index(snapshots, path)
+
+def _refresh_in_background(path, client):
+    with _refresh_lock:
+        thread = _refresh_threads.get(path)
+        if thread is not None and thread.is_alive():
+            return
+
+        def _run():
+            try:
+                refresh_snapshot_index(path, client)
+            except Exception:
+                log_event(logger, "Erro ao atualizar o índice de snapshots", logging.ERROR, exc_info=True, path=path)
+
+        thread = threading.Thread(target=_run, name="rfv-snapshot-index", daemon=True)
+        _refresh_threads[path] = thread
+        thread.start()
+
+def get_snapshot_index(path=SNAPSHOT_INDEX_PATH, client=None, max_age_seconds=REFRESH_INTERVAL_SECONDS):
+    """
+    Datas dos snapshots disponíveis (datetime, mais recente primeiro), lidas do índice persistido.
+    Um índice velho é devolvido na hora e atualizado em segundo plano; sem índice, a consulta é
+    feita na hora. Retorna lista vazia se não houver índice e a consulta falhar.
+    """
+    snapshots, refreshed_at = read_snapshot_index(path)
+    if snapshots is None:
+        return refresh_snapshot_index(path, client) or []
+    if time.time() - refreshed_at > max_age_seconds:
+        _refresh_in_background(path, client)
+    return snapshots
+
+
+if __name__ == '__main__':
+    # Grava o índice (ex: no build da imagem). Código 1 se a consulta falhar.
+    import sys
+
+    written = refresh_snapshot_index()
+    if not written:
+        print(f"Não foi possível gravar o índice de snapshots em {SNAPSHOT_INDEX_PATH}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Índice de snapshots gravado em {SNAPSHOT_INDEX_PATH}: {len(written)} datas, a mais recente {written[0].date()}")
@@ -1,9 +1,15 @@
 # Em core/tava_ta_analyzer.py
 
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
-from tqdm import tqdm
 from .rfv_rules import RFV_RULES_ANTIGO, RFV_RULES_NOVO, CATEGORIAS_ANTIGO, CATEGORIAS_NOVO
-from .rfv_calculator import calculate_customer_rfv
+from .rfv_calculator import (
+    calculate_rfv_batch, calculate_rfv_multi_date, calculate_rfv_metrics_by_focus, score_rfv_metrics,
+)
+from .rfv_tables import get_category_table, CATEGORIA_NOVO_CLIENTE
+from utils.logger import span
 
 def get_category(score, model_type):
     if score < 3: return "CHURN"
@@ -13,59 +19,174 @@ def get_category(score, model_type):
         elif isinstance(key, tuple) and key[0] <= score <= key[1]: return category_name
     return "INDEFINIDO"
 
-def get_customer_segments(df_all_transactions, analysis_date, model_type, focus_type, status_ui=None):
-    if status_ui:
-        status_ui.write(f"Iniciando análise para **{focus_type}** (Data: {analysis_date.strftime('%d/%m/%Y')})...")
+def get_categories(scores, model_type):
+    """Versão vetorizada de get_category: categoriza um array inteiro de scores."""
+    table = get_category_table(model_type)
+    return table.names(table.codes(scores))
+
+SKU_MAP = {'Cápsulas': ['Cápsula'], 'Insumos': ['Filtro', 'CO2'], 'Filtro': ['Filtro'], 'Cilindros': ['CO2']}
 
+def _get_focus_transactions(df_all_transactions, model_type, focus_type, status_ui=None):
+    """Valida o foco e filtra as transações dos SKUs dele. Retorna (regras, df_focus) ou (None, None)."""
     rules_set = RFV_RULES_NOVO if model_type == 'novo' else RFV_RULES_ANTIGO
     if focus_type not in rules_set:
         if status_ui: status_ui.error(f"Erro: Foco '{focus_type}' inválido para o modelo '{model_type}'.")
-        return pd.DataFrame()
+        return None, None
+
+    df_focus = df_all_transactions[df_all_transactions['tipo_sku'].isin(SKU_MAP.get(focus_type, []))]
 
-    sku_map = {'Cápsulas': ['Cápsula'], 'Insumos': ['Filtro', 'CO2'], 'Filtro': ['Filtro'], 'Cilindros': ['CO2']}
-    df_focus = df_all_transactions[df_all_transactions['tipo_sku'].isin(sku_map.get(focus_type, []))]
-    
     if df_focus.empty:
         if status_ui: status_ui.warning(f"AVISO: Nenhuma transação encontrada para '{focus_type}'.")
+        return None, None
+    return rules_set[focus_type], df_focus
+
+def _build_segments(df_rfv, all_customer_ids, first_purchase, analysis_date, model_type):
+    """Categoriza o resultado de R/F/V de uma data, aplicando a regra de NOVO CLIENTE (tenure <= 90 dias)."""
+    # Clientes sem transações no foco ficam com score 0, como no cálculo cliente a cliente.
+    total_score = df_rfv['Total_score'].reindex(all_customer_ids, fill_value=0).astype('int64')
+
+    category_table = get_category_table(model_type)
+    category_codes = category_table.codes(total_score.to_numpy())
+
+    analysis_date_dt = pd.to_datetime(analysis_date)
+    # Clientes sem data de primeira compra (NaT) nunca são marcados como novos
+    tenure_days = (analysis_date_dt - first_purchase.reindex(all_customer_ids)).dt.days
+    category_codes[(tenure_days <= 90).to_numpy()] = category_table.code_of(CATEGORIA_NOVO_CLIENTE)
+
+    return pd.DataFrame({'categoria': category_table.names(category_codes), 'Total_score': total_score})
+
+def get_customer_segments(df_all_transactions, analysis_date, model_type, focus_type, status_ui=None):
+    if status_ui:
+        status_ui.write(f"Iniciando análise para **{focus_type}** (Data: {analysis_date.strftime('%d/%m/%Y')})...")
+
+    with span('segmentos.filtro_foco', foco=focus_type, modelo=model_type) as stage:
+        rules_config, df_focus = _get_focus_transactions(df_all_transactions, model_type, focus_type, status_ui)
+        stage.set(rows=0 if df_focus is None else len(df_focus))
+    if df_focus is None:
         return pd.DataFrame()
 
-    all_customer_ids = df_all_transactions['cod_cliente'].unique()
-    customers_in_focus = set(df_focus['cod_cliente'].unique())
-    grouped_by_customer_in_focus = df_focus.groupby('cod_cliente')
-    
-    results_list = []
-    
-    progress_bar = None
+    with span('segmentos.primeira_compra'):
+        all_customer_ids = pd.Index(df_all_transactions['cod_cliente'].unique(), name='cod_cliente')
+        first_purchase = df_all_transactions.groupby('cod_cliente')['data_compra'].min()
+
+    # Um único groupby vetorizado para todos os clientes (ver calculate_rfv_batch).
+    with span('segmentos.rfv_batch', clientes=len(all_customer_ids)):
+        df_rfv = calculate_rfv_batch(df_focus, analysis_date, rules_config)
+    with span('segmentos.categorias'):
+        return _build_segments(df_rfv, all_customer_ids, first_purchase, analysis_date, model_type)
+
+def get_customer_segments_multi_date(df_all_transactions, analysis_dates, model_type, focus_type, status_ui=None):
+    """
+    Segmenta a base em várias datas de análise com uma única varredura das transações
+    (ver calculate_rfv_multi_date). Ideal para reconstruir o histórico de snapshots semanais.
+
+    Returns:
+        pd.DataFrame: Indexado por ('data_snapshot', 'cod_cliente'), com as colunas 'categoria' e
+            'Total_score'. Cada data tem exatamente o resultado de get_customer_segments.
+    """
     if status_ui:
-        # --- MELHORIA AQUI: Texto da barra de progresso mais específico ---
-        progress_text = f"Processando {len(all_customer_ids)} clientes para a análise de '{focus_type}'..."
-        progress_bar = status_ui.progress(0, text=progress_text)
-    
-    for i, customer_id in enumerate(all_customer_ids):
-        if customer_id in customers_in_focus:
-            customer_df = grouped_by_customer_in_focus.get_group(customer_id)
-            rfv_result = calculate_customer_rfv(customer_df, analysis_date, rules_set[focus_type])
-            rfv_result['cod_cliente'] = customer_id
-        else:
-            rfv_result = {'cod_cliente': customer_id, 'Total_score': 0}
-        
-        results_list.append(rfv_result)
-        
-        if progress_bar:
-            progress_bar.progress((i + 1) / len(all_customer_ids))
+        status_ui.write(f"Iniciando análise para **{focus_type}** em {len(analysis_dates)} datas...")
+
+    rules_config, df_focus = _get_focus_transactions(df_all_transactions, model_type, focus_type, status_ui)
+    if df_focus is None:
+        return pd.DataFrame()
 
+    all_customer_ids = pd.Index(df_all_transactions['cod_cliente'].unique(), name='cod_cliente')
+    first_purchase = df_all_transactions.groupby('cod_cliente')['data_compra'].min()
+
+    progress_bar = status_ui.progress(0, text=f"Processando {len(analysis_dates)} datas para '{focus_type}'...") if status_ui else None
+    segments = {}
+    with span('segmentos.multi_data', foco=focus_type, modelo=model_type, datas=len(analysis_dates), rows=len(df_focus)):
+        for i, (analysis_date, df_rfv) in enumerate(calculate_rfv_multi_date(df_focus, analysis_dates, rules_config)):
+            segments[analysis_date] = _build_segments(df_rfv, all_customer_ids, first_purchase, analysis_date, model_type)
+            if progress_bar: progress_bar.progress((i + 1) / len(analysis_dates))
     if progress_bar: progress_bar.empty()
 
-    df_results = pd.DataFrame(results_list)
-    df_results['categoria'] = df_results['Total_score'].apply(lambda score: get_category(score, model_type))
+    return pd.concat(segments, names=['data_snapshot'])
 
-    first_purchase = df_all_transactions.groupby('cod_cliente')['data_compra'].min().rename('data_primeira_compra')
-    df_results = df_results.merge(first_purchase, on='cod_cliente', how='left')
-    
-    analysis_date_dt = pd.to_datetime(analysis_date)
-    # Garante que não há NaT na data da primeira compra para o cálculo do tenure
-    df_results['data_primeira_compra'].dropna(inplace=True)
-    tenure_days = (analysis_date_dt - df_results['data_primeira_compra']).dt.days
-    df_results.loc[tenure_days <= 90, 'categoria'] = 'NOVO CLIENTE'
-    
-    return df_results[['cod_cliente', 'categoria', 'Total_score']].set_index('cod_cliente')
\ No newline at end of file
+
+# --- Todos os Modelos e Focos de Uma Vez ---
+
+# Colunas de categoria da tabela de histórico calculadas a partir das regras de core/rfv_rules.py.
+# As colunas 'categoria_geral_*' não têm regras de RFV neste repositório e ficam fora deste cálculo.
+FOCUS_COLUMNS = {
+    ('novo', 'Cápsulas'): 'categoria_capsulas_novo',
+    ('novo', 'Filtro'): 'categoria_filtro_novo',
+    ('novo', 'Cilindros'): 'categoria_cilindro_novo',
+    ('antigo', 'Cápsulas'): 'categoria_capsulas_antigo',
+    ('antigo', 'Insumos'): 'categoria_insumos_antigo',
+}
+
+# Abaixo disso, o custo de copiar os dados para outros processos não compensa
+MIN_ROWS_PER_SHARD = 250_000
+
+def _segment_all_focuses(df_all_transactions, analysis_date, focus_columns):
+    """Categoriza os clientes em todos os (modelo, foco) pedidos, com um único agrupamento das transações."""
+    focus_skus = {focus_type: SKU_MAP[focus_type] for _, focus_type in focus_columns}
+    metrics = calculate_rfv_metrics_by_focus(df_all_transactions, analysis_date, focus_skus)
+    all_customer_ids = pd.Index(df_all_transactions['cod_cliente'].unique(), name='cod_cliente')
+    first_purchase = df_all_transactions.groupby('cod_cliente')['data_compra'].min()
+
+    segments = {}
+    scored = {}  # Foco -> (regras, df_rfv): Cápsulas tem as mesmas regras nos dois modelos e é pontuado uma vez
+    for (model_type, focus_type), column in focus_columns.items():
+        rules_config = (RFV_RULES_NOVO if model_type == 'novo' else RFV_RULES_ANTIGO)[focus_type]
+        if focus_type in scored and scored[focus_type][0] == rules_config:
+            df_rfv = scored[focus_type][1]
+        else:
+            df_rfv = score_rfv_metrics(metrics[focus_type], rules_config)
+            scored[focus_type] = (rules_config, df_rfv)
+        segments[column] = _build_segments(df_rfv, all_customer_ids, first_purchase, analysis_date, model_type)['categoria']
+    return pd.DataFrame(segments, index=all_customer_ids)
+
+def get_all_customer_segments(df_all_transactions, analysis_date, max_workers=None, status_ui=None):
+    """
+    Calcula de uma vez as colunas de categoria de todos os modelos e focos (FOCUS_COLUMNS), para
+    montar o snapshot da tabela de histórico. Os clientes são divididos em fatias pelo hash de
+    cod_cliente e cada fatia é processada em um processo separado (ProcessPoolExecutor).
+
+    Args:
+        df_all_transactions (pd.DataFrame): Todas as transações, como em get_customer_segments.
+        analysis_date (datetime): A data de referência (data do snapshot).
+        max_workers (int): Número máximo de processos (padrão: número de CPUs). Com 1, ou com
+            poucas transações, roda no próprio processo.
+
+    Returns:
+        pd.DataFrame: Indexado por 'cod_cliente' (na ordem de aparição), com uma coluna por item de
+            FOCUS_COLUMNS. Cada coluna é igual à 'categoria' de get_customer_segments para aquele
+            modelo e foco; focos sem nenhuma transação ficam com a coluna vazia (NaN).
+    """
+    if status_ui:
+        status_ui.write(f"Iniciando análise de todos os focos (Data: {analysis_date.strftime('%d/%m/%Y')})...")
+
+    # Focos sem transações são avaliados na base toda, não em cada fatia
+    focus_columns = {}
+    for (model_type, focus_type), column in FOCUS_COLUMNS.items():
+        if df_all_transactions['tipo_sku'].isin(SKU_MAP[focus_type]).any():
+            focus_columns[(model_type, focus_type)] = column
+        elif status_ui:
+            status_ui.warning(f"AVISO: Nenhuma transação encontrada para '{focus_type}'.")
+
+    all_customer_ids = pd.Index(df_all_transactions['cod_cliente'].unique(), name='cod_cliente')
+    n_shards = max(1, min(max_workers or os.cpu_count() or 1, len(df_all_transactions) // MIN_ROWS_PER_SHARD))
+
+    with span('segmentos.todos_focos', rows=len(df_all_transactions), clientes=len(all_customer_ids), fatias=n_shards):
+        if n_shards == 1:
+            df_segments = _segment_all_focuses(df_all_transactions, analysis_date, focus_columns)
+        else:
+            # Hash estável entre processos (o hash() do Python muda a cada execução)
+            shard_of_row = pd.util.hash_array(df_all_transactions['cod_cliente'].to_numpy()) % n_shards
+            progress_bar = status_ui.progress(0, text=f"Processando {n_shards} fatias de clientes...") if status_ui else None
+            with ProcessPoolExecutor(max_workers=n_shards) as executor:
+                futures = [
+                    executor.submit(_segment_all_focuses, df_all_transactions[shard_of_row == shard], analysis_date, focus_columns)
+                    for shard in range(n_shards)
+                ]
+                parts = []
+                for i, future in enumerate(futures):
+                    parts.append(future.result())
+                    if progress_bar: progress_bar.progress((i + 1) / n_shards)
+            if progress_bar: progress_bar.empty()
+            df_segments = pd.concat(parts).reindex(all_customer_ids)
+
+    return df_segments.reindex(columns=list(FOCUS_COLUMNS.values()))
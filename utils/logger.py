@@ -0,0 +1,208 @@
+# Em utils/logger.py
+
+"""
+Instrumentação do app: logs estruturados em JSON e medição de tempo por etapa ("spans").
+
+- get_logger(name): logger que escreve uma linha JSON por evento no stdout. O Cloud Run entende
+  os campos 'severity' e 'message', então os logs já chegam estruturados no Cloud Logging.
+- request_trace(name): agrupa as etapas de uma requisição (ex: um clique em "Processar Análise")
+  e, ao final, registra o tempo total e a memória: RSS no início e no fim e o pico do RSS durante
+  a requisição (amostrado a cada RFV_TRACE_SAMPLE_MS). O RSS é do processo inteiro: com outras
+  requisições rodando ao mesmo tempo (campo 'concurrent_requests' > 1) o pico inclui a memória
+  delas e não é só desta requisição.
+- span(name, **fields): mede uma etapa. Campos extras (linhas, bytes, cache hit/miss...) podem ser
+  passados na criação ou com span.set(...) durante a etapa.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+SAMPLE_INTERVAL_SECONDS = int(os.environ.get("RFV_TRACE_SAMPLE_MS", 50)) / 1000
+
+_current_trace = contextvars.ContextVar("rfv_current_trace", default=None)
+
+
+# --- Logs em JSON ---
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'severity': record.levelname,
+            'message': record.getMessage(),
+            'logger': record.name,
+            'timestamp': self.formatTime(record, "%Y-%m-%dT%H:%M:%S%z"),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+_configured = False
+_configure_lock = threading.Lock()
+
+def get_logger(name="rfv"):
+    global _configured
+    with _configure_lock:
+        if not _configured:
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setFormatter(JsonFormatter())
+            root = logging.getLogger("rfv")
+            root.addHandler(handler)
+            root.setLevel(os.environ.get("RFV_LOG_LEVEL", "INFO"))
+            root.propagate = False
+            _configured = True
+    return logging.getLogger(name if name.startswith("rfv") else f"rfv.{name}")
+
+def log_event(logger, message, level=logging.INFO, exc_info=False, **fields):
+    """Registra um evento com campos estruturados."""
+    trace = _current_trace.get()
+    if trace is not None:
+        fields.setdefault('request_id', trace.request_id)
+    logger.log(level, message, exc_info=exc_info, extra={'fields': fields})
+
+
+# --- Memória ---
+
+def _rss_mb():
+    """Memória residente atual do processo (Linux); None se não disponível."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except (OSError, ValueError, IndexError):
+        return None
+
+# Uma única thread amostra o RSS enquanto houver requisições abertas e atualiza o pico de cada uma
+_active_traces = set()
+_active_traces_lock = threading.Lock()
+_sampler = None
+
+def _sample_memory():
+    global _sampler
+    while True:
+        with _active_traces_lock:
+            if not _active_traces:
+                _sampler = None
+                return
+            traces = list(_active_traces)
+        rss = _rss_mb()
+        for trace in traces:
+            trace.observe_rss(rss)
+        time.sleep(SAMPLE_INTERVAL_SECONDS)
+
+def _start_memory_sampling(trace):
+    global _sampler
+    with _active_traces_lock:
+        _active_traces.add(trace)
+        for active in _active_traces:
+            active.concurrent_requests = max(active.concurrent_requests, len(_active_traces))
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_memory, name="rfv-trace-memory", daemon=True)
+            _sampler.start()
+
+def _stop_memory_sampling(trace):
+    with _active_traces_lock:
+        _active_traces.discard(trace)
+
+
+# --- Traces e Spans ---
+
+class Span:
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = dict(fields)
+        self.duration_ms = None
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def as_dict(self):
+        return {'span': self.name, 'duration_ms': self.duration_ms, **self.fields}
+
+
+class Trace:
+    def __init__(self, name):
+        self.name = name
+        self.request_id = uuid.uuid4().hex[:12]
+        self.spans = []
+        self.summary = {}
+        self.rss_peak_mb = None
+        self.concurrent_requests = 1
+        self._lock = threading.Lock()
+
+    def observe_rss(self, rss_mb):
+        if rss_mb is not None:
+            with self._lock:
+                self.rss_peak_mb = rss_mb if self.rss_peak_mb is None else max(self.rss_peak_mb, rss_mb)
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def as_records(self):
+        """Uma linha por etapa (para exibir no painel de debug)."""
+        with self._lock:
+            return [span.as_dict() for span in self.spans]
+
+
+_logger = get_logger("rfv.trace")
+
+@contextmanager
+def request_trace(name, **fields):
+    """Abre um trace para uma requisição; as spans abertas dentro dele (na mesma thread) entram nele."""
+    trace = Trace(name)
+    token = _current_trace.set(trace)
+    rss_start = _rss_mb()
+    trace.observe_rss(rss_start)
+    _start_memory_sampling(trace)
+    start = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        _stop_memory_sampling(trace)
+        rss_end = _rss_mb()
+        trace.observe_rss(rss_end)
+        trace.summary = {
+            'request': name,
+            'duration_ms': round((time.perf_counter() - start) * 1000, 1),
+            'rss_start_mb': rss_start,
+            'rss_end_mb': rss_end,
+            # Pico do RSS do processo durante a requisição (inclui as requisições simultâneas)
+            'rss_peak_mb': trace.rss_peak_mb,
+            'rss_peak_delta_mb': None if rss_start is None else trace.rss_peak_mb - rss_start,
+            'concurrent_requests': trace.concurrent_requests,
+            **fields,
+        }
+        log_event(_logger, "request", **trace.summary)
+        _current_trace.reset(token)
+
+@contextmanager
+def span(name, trace=None, **fields):
+    """
+    Mede uma etapa e registra um log JSON com a duração e os campos. Entra no trace atual (ou no
+    `trace` passado, útil quando a etapa roda em outra thread).
+    """
+    trace = trace if trace is not None else _current_trace.get()
+    current = Span(name, fields)
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield current
+    except Exception:
+        status = 'erro'
+        raise
+    finally:
+        current.duration_ms = round((time.perf_counter() - start) * 1000, 1)
+        current.fields['status'] = status
+        if trace is not None:
+            trace.add(current)
+            current.fields.setdefault('request_id', trace.request_id)
+        # Fora de um trace (ex: scripts e benchmarks) as etapas só aparecem com RFV_LOG_LEVEL=DEBUG
+        log_event(_logger, "span", logging.INFO if trace is not None else logging.DEBUG, **current.as_dict())
+